@@ -0,0 +1,223 @@
+"""
+Benchmarks for the mapper's hot paths, on synthetic data.
+
+    python bench_mapper.py --rows 10000 --width 20 --cardinality 100 --output run.json
+    python bench_mapper.py --compare run.json --threshold 0.2
+    python bench_mapper.py --load-width 5000
+
+Each benchmark reports ns/op and ops/sec (rows/sec for whole-line benchmarks).
+When comparing against a previous run, exits non-zero if any benchmark
+is more than `threshold` (a fraction) slower.
+"""
+
+import argparse
+import base64
+import io
+import json
+import random
+import sys
+import time
+
+import yaml
+
+from mapper import apply_replaces, CLEANERS, clean, compile_mapping, decode_raw_value, \
+                   mapped_line, mapped_value
+from mapper.codegen import generated_map_line
+from mapper.loading import load_mapping
+
+NAMES = ['smith', 'o.brien', 'jones,  jnr', 'van`t hoff', 'patel']
+CLEAN_SAMPLES = {
+    ':sex': ['M', 'f', '1', '2', 'unknown'],
+    ':name': NAMES,
+    ':nhsnumber': ['123 456 7890', '1234567890', '12-34-56-78-90-1'],
+    ':ethniccategory': ['1', '99', 'A', 'z'],
+    ':upcase': NAMES,
+    ':code': ['C34.3,R93.2;Z51.5', 'U212 Y973'],
+    ':icd': ['c34.3,r93.2;z51.5', 'C50'],
+    ':code_opcs': ['U212,Y973,X1', 'AbcD'],
+    ':postcode': ['cb30ds', 'b1 1aa', 'SW1A 1AA', 'rubbish']
+}
+
+def synthetic_values(count, cardinality, make, rng):
+    """
+    returns `count` values drawn from `cardinality` distinct ones built by `make`.
+    """
+    domain = [make(i, rng) for i in range(cardinality)]
+    return [rng.choice(domain) for _ in range(count)]
+
+def synthetic_date(i, rng):
+    return '%02d/%02d/%04d' % (rng.randint(1, 28), rng.randint(1, 12), rng.randint(1930, 2020))
+
+def synthetic_name(i, rng):
+    return '%s %d' % (rng.choice(NAMES), i)
+
+def synthetic_mapping(width):
+    """
+    returns a mapping of `width` columns, cycling through
+    plain, clean, format, map and replace mappings.
+    """
+    kinds = [
+        {},
+        {'clean': ':name'},
+        {'format': '%d/%m/%Y'},
+        {'map': {'smith 0': 'SMITH'}},
+        {'replace': {'\\.': '', 'jnr': 'junior'}}
+    ]
+
+    mapping = []
+    for col in range(width):
+        field_mapping = dict(kinds[col % len(kinds)], field='field%d' % col)
+        mapping.append({'column': 'column%d' % col, 'mappings': [field_mapping]})
+
+    return mapping
+
+def synthetic_lines(rows, width, cardinality, seed=0):
+    """
+    returns `rows` lines to suit `synthetic_mapping(width)`, with
+    each column drawing from `cardinality` distinct values.
+    """
+    rng = random.Random(seed)
+    columns = []
+    for col in range(width):
+        make = synthetic_date if col % 5 == 2 else synthetic_name
+        columns.append(synthetic_values(rows, cardinality, make, rng))
+
+    return [list(line) for line in zip(*columns)]
+
+def time_per_op(function, inputs, repeat):
+    """
+    returns the best (lowest) ns per call of `function` over `inputs`.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for value in inputs:
+            function(value)
+        elapsed = (time.perf_counter_ns() - start) / len(inputs)
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def benchmarks(rows, width, cardinality, seed=0):
+    """
+    yields (name, function, inputs) for each hot path.
+    """
+    rng = random.Random(seed)
+    mapping = synthetic_mapping(width)
+    lines = synthetic_lines(rows, width, cardinality, seed)
+
+    yield 'mapped_line', lambda line: mapped_line(line, mapping), lines
+    yield 'map_line (compiled)', compile_mapping(mapping).map_line, lines
+    yield 'map_line (generated)', generated_map_line(mapping), lines
+
+    for what in sorted(CLEANERS):
+        samples = CLEAN_SAMPLES.get(what, NAMES)
+        values = synthetic_values(rows, cardinality, lambda i, r: r.choice(samples), rng)
+        yield 'clean %s' % what, lambda value, what=what: clean(value, what), values
+
+    dates = synthetic_values(rows, cardinality, synthetic_date, rng)
+    names = synthetic_values(rows, cardinality, synthetic_name, rng)
+
+    format_mapping = {'format': '%d/%m/%Y'}
+    map_mapping = {'map': {name: name.upper() for name in names[::2]}}
+    match_mapping = {'match': '([0-9]+)'}
+    replaces = {'\\.': '', 'jnr': 'junior', '\\s+': ' '}
+
+    yield 'mapped_value format', lambda value: mapped_value(value, format_mapping), dates
+    yield 'mapped_value map', lambda value: mapped_value(value, map_mapping), names
+    yield 'mapped_value match', lambda value: mapped_value(value, match_mapping), names
+    yield 'apply_replaces', lambda value: apply_replaces(value, replaces), names
+
+    encoded = [base64.b64encode(name.encode()) for name in names]
+    yield 'decode_raw_value base64', lambda value: decode_raw_value(value, 'base64'), encoded
+
+def run(rows, width, cardinality, repeat=3, seed=0):
+    """
+    runs every benchmark, returning a dict of results by name.
+    """
+    results = {}
+    for name, function, inputs in benchmarks(rows, width, cardinality, seed):
+        ns_per_op = time_per_op(function, inputs, repeat)
+        results[name] = {'ns_per_op': ns_per_op, 'ops_per_sec': 1e9 / ns_per_op}
+
+    return results
+
+def load_timings(width, repeat=3):
+    """
+    returns the best seconds taken by each stage of loading
+    `synthetic_mapping(width)` from YAML, e.g. at worker startup.
+    """
+    text = yaml.safe_dump(synthetic_mapping(width)).encode()
+
+    best = {}
+    for _ in range(repeat):
+        timings = {}
+        load_mapping(io.BytesIO(text), timings)
+        for stage in ('read', 'parse', 'validate'):
+            best[stage] = min(best.get(stage, timings[stage]), timings[stage])
+
+    return best
+
+def regressions(baseline, results, threshold):
+    """
+    returns (name, old ns/op, new ns/op) for each benchmark that is
+    more than `threshold` (a fraction) slower than in `baseline`.
+    """
+    slower = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous and result['ns_per_op'] > previous['ns_per_op'] * (1 + threshold):
+            slower.append((name, previous['ns_per_op'], result['ns_per_op']))
+
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--width', type=int, default=20)
+    parser.add_argument('--cardinality', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='save results as JSON to this path')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fraction slower than the previous run that counts as a regression')
+    parser.add_argument('--load-width', type=int, default=0,
+                        help='also time loading a mapping of this many columns')
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.width, args.cardinality, args.repeat, args.seed)
+
+    if args.load_width:
+        for stage, seconds in load_timings(args.load_width, args.repeat).items():
+            name = 'load_mapping %d columns %s' % (args.load_width, stage)
+            results[name] = {'ns_per_op': seconds * 1e9, 'ops_per_sec': 1 / seconds}
+
+    for name, result in results.items():
+        rate = 'rows/sec' if 'line' in name else 'ops/sec'
+        print('%-34s %12.0f ns/op %14.0f %s' % (name, result['ns_per_op'], result['ops_per_sec'], rate))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                'parameters': {'rows': args.rows, 'width': args.width,
+                               'cardinality': args.cardinality, 'seed': args.seed},
+                'results': results
+            }, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+
+        slower = regressions(baseline, results, args.threshold)
+        for name, before, after in slower:
+            print('REGRESSION %s: %.0f -> %.0f ns/op' % (name, before, after))
+
+        if slower:
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
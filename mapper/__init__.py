@@ -4,6 +4,9 @@ A Python port of ndr_import's mapper module.
 Primarily defines:
 
     mapped_line(line, line_mappings)
+    mapped_lines(lines, line_mappings)
+    map_columns(columns, line_mappings)
+    compile_mapping(line_mappings).map_line(line)
 
 Known issues:
 * Doesn't support serialised Ruby Regexps - needs native pattern instead.
@@ -11,13 +14,17 @@ Known issues:
 * Not all "clean" directives are supported.
 """
 
-import base64
+from collections import namedtuple, OrderedDict
+from collections.abc import Mapping
 import copy
 from datetime import datetime
+from functools import lru_cache
 import re
 import sys
 import yaml
 
+from mapper.decoders import decoder_for
+
 if sys.version_info[0] < 3:
     raise SystemExit('Use Python 3 (or higher) only')
 
@@ -29,68 +36,183 @@ def isblank(obj):
            (isinstance(obj, str) and obj.isspace()) or \
            (hasattr(obj, 'length') and obj.length == 0)
 
-def clean(string, what):
+REGEX_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=REGEX_CACHE_SIZE)
+def compiled_pattern(pattern):
     """
-    port of ndr_support's string cleaning behaviour.
-    Assumes a "symbol" for the value of `what`.
+    returns the compiled form of a mapping's regular expression `pattern`.
+
+    Unlike the `re` module's own small cache, this is sized to hold every
+    pattern of even wide mappings; `compiled_pattern.cache_info()` reports
+    hits, misses and current size.
     """
-    if what == ':sex':
-        if re.match('^M|1', string, re.I):
-            return '1'
-        if re.match('^F|2', string, re.I):
-            return '2'
-        return '0'
-
-    if what == ':name':
-        substitutions = {
-            '\.': '',
-            ',|;': ' ',
-            '\s{2,}': ' ',
-            '`': '\''
-        }
+    return re.compile(pattern)
+
+SEX_MALE_PATTERN = re.compile('^M|1', re.I)
+SEX_FEMALE_PATTERN = re.compile('^F|2', re.I)
+
+NAME_SUBSTITUTIONS = (
+    (re.compile(r'\.'), ''),
+    (re.compile(',|;'), ' '),
+    (re.compile(r'\s{2,}'), ' '),
+    (re.compile('`'), '\'')
+)
+
+ETHNIC_CATEGORIES = {
+    '0': '0',
+    '1': 'M',
+    '2': 'N',
+    '3': 'H',
+    '4': 'J',
+    '5': 'K',
+    '6': 'R',
+    '7': '8',
+    '&': 'X',
+    ' ': 'X',
+    '99': 'X'
+}
+
+NON_DIGIT_PATTERN = re.compile('[^0-9]')
+NON_ALPHANUMERIC_PATTERN = re.compile('[^A-Z0-9]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+CODE_SEPARATOR_PATTERN = re.compile(' |,|;')
+OPCS_SPECIAL_CODE_PATTERN = re.compile('CZ00[12]')
+POSTCODE_PATTERN = re.compile(
+    '^([A-Z][0-9]|[A-Z][0-9][0-9]|[A-Z][0-9][A-Z]|'
+    '[A-Z][A-Z][0-9]|[A-Z][A-Z][0-9][0-9]|[A-Z][A-Z][0-9][A-Z])'
+    '[0-9][A-Z][A-Z]$'
+)
+
+def clean_sex(string):
+    """
+    cleans to '1' (male), '2' (female) or '0' (unknown).
+    """
+    if SEX_MALE_PATTERN.match(string):
+        return '1'
+    if SEX_FEMALE_PATTERN.match(string):
+        return '2'
+    return '0'
 
-        string = string.upper()
+def clean_name(string):
+    """
+    upcases, and strips punctuation and excess whitespace from, a name.
+    """
+    string = string.upper()
 
-        for pattern, replacement in substitutions.items():
-            string = re.sub(pattern, replacement, string)
+    for pattern, replacement in NAME_SUBSTITUTIONS:
+        string = pattern.sub(replacement, string)
 
-        return string.strip()
+    return string.strip()
+
+def clean_nhsnumber(string):
+    """
+    keeps (up to) the first ten digits.
+    """
+    return NON_DIGIT_PATTERN.sub('', string)[0:10]
 
-    if what == ':nhsnumber':
-        return re.sub('[^0-9]', '', string)[0:10]
+def clean_ethniccategory(string):
+    """
+    maps legacy ethnic category codes onto current ones.
+    """
+    return ETHNIC_CATEGORIES.get(string, string.upper())
 
-    if what == ':ethniccategory':
-        return {
-            '0': '0',
-            '1': 'M',
-            '2': 'N',
-            '3': 'H',
-            '4': 'J',
-            '5': 'K',
-            '6': 'R',
-            '7': '8',
-            '&': 'X',
-            ' ': 'X',
-            '99': 'X'
-        }.get(string, string.upper())
+def clean_upcase(string):
+    """
+    upcases the string.
+    """
+    return string.upper()
 
-    if what == ':upcase':
-        return string.upper()
+def clean_code(string):
+    """
+    splits a list of codes, removing any dots from each.
+    """
+    codes = []
 
-    if what == ':code':
-        codes = []
+    for code in CODE_SEPARATOR_PATTERN.split(string):
+        code = code.replace('.', '')
 
-        for code in re.split(' |,|;', string):
-           code = re.sub('\.', '', code)
+        if isblank(code):
+            continue
 
-           if isblank(code):
-               continue
+        codes.append(code)
+
+    return ' '.join(codes)
+
+def clean_icd(string):
+    """
+    splits a list of ICD codes, upcasing and removing any dots from each.
+    """
+    return clean_code(string.upper())
+
+def clean_code_opcs(string):
+    """
+    splits a list of OPCS codes, keeping only those that are
+    four characters long once squashed (or are special CZ codes).
+    """
+    codes = []
+
+    for code in CODE_SEPARATOR_PATTERN.split(string):
+        code = NON_ALPHANUMERIC_PATTERN.sub('', code.upper())
+
+        if len(code) == 4 or OPCS_SPECIAL_CODE_PATTERN.search(code):
+            codes.append(code)
+
+    return ' '.join(codes)
+
+def clean_postcode(string):
+    """
+    formats a valid postcode as a 7 character database postcode,
+    leaving old-style or malformed postcodes unchanged.
+    """
+    compact = WHITESPACE_PATTERN.sub('', string).upper()
+
+    if compact and not POSTCODE_PATTERN.match(compact):
+        return string
+
+    if len(compact) == 5:
+        return compact[:-3] + '  ' + compact[-3:]
+    if len(compact) == 6:
+        return compact[:-3] + ' ' + compact[-3:]
+
+    return compact
+
+CLEANERS = {
+    ':sex': clean_sex,
+    ':name': clean_name,
+    ':nhsnumber': clean_nhsnumber,
+    ':ethniccategory': clean_ethniccategory,
+    ':upcase': clean_upcase,
+    ':code': clean_code,
+    ':icd': clean_icd,
+    ':code_opcs': clean_code_opcs,
+    ':postcode': clean_postcode
+}
+
+def register_cleaner(what, cleaner):
+    """
+    registers a callable that cleans a single string, for use as
+    `clean: <what>` in mappings (e.g. ':mycleaner'). Mappings compiled
+    before registration are unaffected.
+    """
+    CLEANERS[what] = cleaner
 
-           codes.append(code)
+def cleaner_for(what):
+    """
+    returns the cleaner registered for `what`, or raises.
+    """
+    cleaner = CLEANERS.get(what)
+    if cleaner is None:
+        raise Exception('unknown cleaner: %s!' % what)
 
-        return ' '.join(codes)
+    return cleaner
 
-    raise Exception('unknown cleaner: %s!' % what)
+def clean(string, what):
+    """
+    port of ndr_support's string cleaning behaviour.
+    Assumes a "symbol" for the value of `what`.
+    """
+    return cleaner_for(what)(string)
 
 def decode_raw_value(raw_value, encoding):
     """
@@ -99,10 +221,24 @@ def decode_raw_value(raw_value, encoding):
     if isblank(raw_value):
         return raw_value
 
-    if encoding == 'base64':
-        return base64.b64decode(raw_value)
+    return decoder_for(encoding)(raw_value)
+
+def value_decoder(encoding):
+    """
+    returns a callable equivalent to `decode_raw_value(value, encoding)`,
+    with the decoder resolved up front.
+    """
+    decoder = decoder_for(encoding)
+
+    return lambda raw_value: raw_value if isblank(raw_value) else decoder(raw_value)
+
+def decode_values(raw_values, encoding):
+    """
+    decodes a batch of values (e.g. a column) from `encoding`.
+    """
+    decoder = decoder_for(encoding)
 
-    raise Exception("encoding %s is not implemented!" % encoding)
+    return [raw_value if isblank(raw_value) else decoder(raw_value) for raw_value in raw_values]
 
 def replace_before_mapping(original_value, field_mapping):
     """
@@ -126,14 +262,89 @@ def apply_replaces(value, replaces):
     """
     applies each replacement to the given value.
     """
+    return apply_compiled_replaces(value, compile_replaces(replaces))
+
+def compile_replaces(replaces):
+    """
+    compiles a dict of replaces into a tuple of (regex, replacement) pairs.
+    """
+    return tuple((compiled_pattern(pattern), replacement)
+                 for pattern, replacement in replaces.items())
+
+def apply_compiled_replaces(value, compiled_replaces):
+    """
+    applies each compiled replacement to the given value.
+    """
     if isinstance(value, list):
-        return list(map(lambda v: apply_replaces(v, replaces), value))
+        return list(map(lambda v: apply_compiled_replaces(v, compiled_replaces), value))
 
-    for pattern, replacement in replaces.items():
-        value = re.sub(pattern, replacement, value)
+    for regex, replacement in compiled_replaces:
+        value = regex.sub(replacement, value)
 
     return value
 
+def strptime_or_none(value, date_format):
+    """
+    parses `value` with `date_format`, or returns None if it doesn't match.
+    """
+    try:
+        return datetime.strptime(value, date_format)
+    except ValueError:
+        return None
+
+def fast_date_parser(date_format, year, month, day, separators):
+    """
+    builds a parser for a fixed-width, all-numeric `date_format`, given
+    the (start, end) positions of each part and a {position: separator}
+    dict. Values of any other shape fall back to strptime, so results
+    always match `strptime_or_none`.
+    """
+    length = year[1] - year[0] + month[1] - month[0] + day[1] - day[0] + len(separators)
+    year, month, day = slice(*year), slice(*month), slice(*day)
+    separators = tuple(separators.items())
+
+    def parse(value):
+        if not (isinstance(value, str) and len(value) == length and value.isascii()):
+            return strptime_or_none(value, date_format)
+
+        for position, separator in separators:
+            if value[position] != separator:
+                return strptime_or_none(value, date_format)
+
+        parts = (value[year], value[month], value[day])
+        if not all(part.isdigit() for part in parts):
+            return strptime_or_none(value, date_format)
+
+        try:
+            return datetime(int(parts[0]), int(parts[1]), int(parts[2]))
+        except ValueError:
+            return None
+
+    return parse
+
+DATE_PARSERS = {
+    '%Y%m%d': fast_date_parser('%Y%m%d', (0, 4), (4, 6), (6, 8), {}),
+    '%Y-%m-%d': fast_date_parser('%Y-%m-%d', (0, 4), (5, 7), (8, 10), {4: '-', 7: '-'}),
+    '%d/%m/%Y': fast_date_parser('%d/%m/%Y', (6, 10), (3, 5), (0, 2), {2: '/', 5: '/'}),
+    '%d-%m-%Y': fast_date_parser('%d-%m-%Y', (6, 10), (3, 5), (0, 2), {2: '-', 5: '-'}),
+    '%Y/%m/%d': fast_date_parser('%Y/%m/%d', (0, 4), (5, 7), (8, 10), {4: '/', 7: '/'})
+}
+
+DATE_CACHE_SIZE = 65536
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(value, date_format):
+    """
+    parses `value` with `date_format` (returning None if it doesn't match),
+    using a specialised parser for common formats. Results are cached, as
+    the same dates tend to recur; `parse_date.cache_info()` reports usage.
+    """
+    parser = DATE_PARSERS.get(date_format)
+    if parser:
+        return parser(value)
+
+    return strptime_or_none(value, date_format)
+
 def mapped_value(original_value, field_mapping):
     """
     applies the first mapping to the given original_value.
@@ -142,25 +353,18 @@ def mapped_value(original_value, field_mapping):
         if isblank(original_value):
             return None
 
-        try:
-            return datetime.strptime(original_value, field_mapping['format'])
-        except ValueError:
-            return None
+        return parse_date(original_value, field_mapping['format'])
 
     if 'clean' in field_mapping:
-        cleaner = field_mapping['clean']
-        if isinstance(cleaner, list):
-            for cln in cleaner:
-                original_value = clean(original_value, cln)
-        else:
-            original_value = clean(original_value, cleaner)
+        for cleaner in cleaners_for(field_mapping['clean']):
+            original_value = cleaner(original_value)
         return original_value
 
     if 'map' in field_mapping:
         return field_mapping['map'].get(original_value, original_value)
 
     if 'match' in field_mapping:
-        match = re.search(field_mapping['match'], original_value)
+        match = compiled_pattern(field_mapping['match']).search(original_value)
         return match and match.group(1)
 
     if 'daysafter' in field_mapping:
@@ -175,6 +379,53 @@ def mapped_value(original_value, field_mapping):
 
     return original_value
 
+def cleaners_for(what):
+    """
+    resolves a `clean` directive (a single cleaner, or a list
+    of them) into a tuple of cleaner callables.
+    """
+    if isinstance(what, list):
+        return tuple(cleaner_for(cln) for cln in what)
+
+    return (cleaner_for(what),)
+
+def value_converter(field_mapping):
+    """
+    returns a callable equivalent to `mapped_value(value, field_mapping)`,
+    with the field mapping's directives resolved up front where possible.
+    """
+    if 'format' in field_mapping:
+        date_format = field_mapping['format']
+        return lambda value: None if isblank(value) else parse_date(value, date_format)
+
+    if 'clean' in field_mapping:
+        cleaners = cleaners_for(field_mapping['clean'])
+
+        if len(cleaners) == 1:
+            return cleaners[0]
+
+        def convert(value):
+            for cleaner in cleaners:
+                value = cleaner(value)
+            return value
+
+        return convert
+
+    return lambda value: mapped_value(value, field_mapping)
+
+class ValidationError(Exception):
+    """
+    raised when a field's value fails one of its validations,
+    recording the field and the `rule` (e.g. 'presence').
+    """
+    def __init__(self, field, rule, message):
+        super().__init__(message)
+        self.field = field
+        self.rule = rule
+
+    def __reduce__(self):
+        return (ValidationError, (self.field, self.rule, str(self)))
+
 def apply_validations_on(field, value, validations):
     """
     raises if any of the requested validations do not
@@ -183,12 +434,22 @@ def apply_validations_on(field, value, validations):
     if validations['presence']:
         presence_validation_on(field, value)
 
+def failed_rule(value, validations):
+    """
+    returns the first of the requested validations that the value
+    fails (e.g. 'presence'), or None, without raising.
+    """
+    if validations['presence'] and isblank(value):
+        return 'presence'
+
+    return None
+
 def presence_validation_on(field, value):
     """
     raises if the supplied value is blank.
     """
     if isblank(value):
-        raise Exception("%s can't be blank" % field)
+        raise ValidationError(field, 'presence', "%s can't be blank" % field)
 
 def validate_line_mappings(line_mappings):
     """
@@ -220,86 +481,855 @@ def validate_line_mappings(line_mappings):
             else:
                 priorities[field] = 1
 
-def mapped_line(line, line_mappings):
+_NOT_SET = object()
+_INVALID_COLUMN = object()
+
+def collect_value(data, field_plan, value):
     """
-    applies mapping to the given line.
+    records a mapped `value` against its field in `data`, by
+    the order or priority of the mapping that produced it.
+    """
+    field_data = data.get(field_plan.field)
+    if field_data is None:
+        field_data = data[field_plan.field] = {'values': {}, 'compact': True}
+
+    if field_plan.order:
+        if 'join' not in field_data:
+            field_data['join'] = field_plan.join
+
+        if field_plan.compact is not _NOT_SET:
+            field_data['compact'] = field_plan.compact
+
+        field_data['values'][field_plan.order - 1] = value
+    elif field_plan.priority:
+        field_data['values'][field_plan.priority] = value
+    else:
+        field_data['values'][0] = value
+
+def field_value(field_data):
+    """
+    resolves the values collected for a field into its final value,
+    joining them if required, or taking the highest priority one.
+    """
+    # Stored in a dict by "index", retrieve sorted actual values:
+    value_dict = field_data['values']
+    values = list(map(lambda k: value_dict[k], sorted(value_dict)))
+
+    if 'join' in field_data:
+        return joined_value(values, field_data['join'], field_data['compact'])
+
+    return next((v for v in values), None)
+
+def joined_value(values, join, compact):
+    """
+    joins a field's sorted values, compacting away blanks if required.
+    """
+    # Map "blank" values to None:
+    values = map(lambda v: v or None, values)
+
+    if compact:
+        values = list(filter(None, values))
+
+    return join.join(map(lambda v: v or '', values))
+
+def slot_key(field_plan):
+    """
+    returns the position a field plan's value takes amongst those
+    collected for its field (see `collect_value`).
+    """
+    if field_plan.order:
+        return field_plan.order - 1
+
+    return field_plan.priority or 0
+
+RecordLayout = namedtuple('RecordLayout', [
+    'fields', 'field_index', 'slots', 'slot_count', 'groups', 'ordered', 'rawtext_names'
+])
+
+def compile_layout(columns):
+    """
+    resolves a plan's columns into a `RecordLayout`: every field plan gets
+    its own value slot, and each field's slots are pre-sorted into groups
+    by position (latest mapping first), so no sorting is needed per row.
+    """
+    fields = []
+    field_index = {}
+    slots = []
+    slot_count = 0
+    by_field = []
+
+    for column in columns:
+        if column is None or column is _INVALID_COLUMN:
+            slots.append(None)
+            continue
+
+        column_slots = []
+        for field_plan in column.fields:
+            if field_plan.field not in field_index:
+                field_index[field_plan.field] = len(fields)
+                fields.append(field_plan.field)
+                by_field.append([])
+
+            by_field[field_index[field_plan.field]].append((slot_count, field_plan))
+            column_slots.append(slot_count)
+            slot_count += 1
+
+        slots.append(tuple(column_slots))
+
+    groups = []
+    ordered = []
+    for field_slots in by_field:
+        keyed = {}
+        for slot, field_plan in reversed(field_slots):
+            keyed.setdefault(slot_key(field_plan), []).append(slot)
+
+        groups.append(tuple(tuple(keyed[key]) for key in sorted(keyed)))
+        ordered.append(tuple((slot, field_plan.join, field_plan.compact)
+                             for slot, field_plan in field_slots if field_plan.order))
+
+    rawtext_names = tuple(column.rawtext_name if isinstance(column, ColumnPlan) and
+                          column.capture_rawtext else None for column in columns)
+
+    return RecordLayout(tuple(fields), field_index, tuple(slots), slot_count,
+                        tuple(groups), tuple(ordered), rawtext_names)
+
+def record_values(layout, slot_values):
+    """
+    resolves a row's slot values into a list of values by field
+    index (with `_NOT_SET` for fields that weren't mapped), as
+    `field_value` would.
+    """
+    values = []
+
+    for groups, ordered in zip(layout.groups, layout.ordered):
+        collected = []
+        for group in groups:
+            for slot in group:
+                if slot_values[slot] is not _NOT_SET:
+                    collected.append(slot_values[slot])
+                    break
+
+        if not collected:
+            values.append(_NOT_SET)
+            continue
+
+        join = _NOT_SET
+        compact = True
+        for slot, field_join, field_compact in ordered:
+            if slot_values[slot] is not _NOT_SET:
+                if join is _NOT_SET:
+                    join = field_join
+                if field_compact is not _NOT_SET:
+                    compact = field_compact
+
+        if join is _NOT_SET:
+            values.append(collected[0])
+        else:
+            values.append(joined_value(collected, join, compact))
+
+    return values
+
+class MappedRecord:
+    """
+    a compact alternative to the attributes dict returned by `map_line`,
+    holding values by the field index of its plan's shared `RecordLayout`.
+    Supports `record[field]` (including 'rawtext') and `record.to_dict()`.
+
+    `raw_values` holds the captured raw value of each column, or is a
+    `LazyRawtext`, or None if rawtext isn't being captured.
+    """
+    __slots__ = ('layout', 'values', 'raw_values')
+
+    def __init__(self, layout, values, raw_values):
+        self.layout = layout
+        self.values = values
+        self.raw_values = raw_values
+
+    def __getitem__(self, field):
+        if field == 'rawtext':
+            if self.raw_values is None:
+                raise KeyError(field)
+
+            return self.rawtext
+
+        index = self.layout.field_index.get(field)
+        if index is None or self.values[index] is _NOT_SET:
+            raise KeyError(field)
+
+        return self.values[index]
+
+    def __contains__(self, field):
+        return self.get(field, _NOT_SET) is not _NOT_SET
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    @property
+    def rawtext(self):
+        """
+        the dict of raw values by (lowercased) rawtext name.
+        """
+        if isinstance(self.raw_values, LazyRawtext):
+            return self.raw_values
+
+        rawtext = {}
+        if self.raw_values is None:
+            return rawtext
+
+        for name, raw_value in zip(self.layout.rawtext_names, self.raw_values):
+            if name is not None and raw_value is not _NOT_SET:
+                rawtext[name] = raw_value
+
+        return rawtext
+
+    def to_dict(self):
+        """
+        returns the record in the attributes dict form of `map_line`.
+        """
+        attributes = {}
+        for field, value in zip(self.layout.fields, self.values):
+            if value is not _NOT_SET:
+                attributes[field] = value
+
+        if self.raw_values is not None:
+            attributes['rawtext'] = self.rawtext # Assign last
+
+        return attributes
+
+    def __repr__(self):
+        return 'MappedRecord(%r)' % self.to_dict()
+
+def field_plan_converter(field_plan):
+    """
+    returns a callable applying a field plan's replaces and
+    value mapping to a single raw value.
+    """
+    replaces = field_plan.replaces
+    convert = field_plan.convert
+
+    if not replaces:
+        return convert
+
+    return lambda value: convert(apply_field_replaces(value, replaces))
+
+def apply_field_replaces(value, replaces):
+    """
+    applies a field plan's compiled `replaces` to any (non-blank) value.
+    """
+    if value:
+        for compiled_replaces in replaces:
+            value = apply_compiled_replaces(value, compiled_replaces)
+
+    return value
+
+def mapped_unique_values(values, function):
+    """
+    applies `function` to a column of `values`, calling it only once
+    per distinct value (unless the values are unhashable).
+    """
+    try:
+        lookup = {value: None for value in values}
+    except TypeError:
+        return [function(value) for value in values]
+
+    for value in lookup:
+        lookup[value] = function(value)
+
+    return [lookup[value] for value in values]
+
+ColumnPlan = namedtuple('ColumnPlan', ['rawtext_name', 'decode', 'fields', 'capture_rawtext'])
+
+class LazyRawtext(Mapping):
     """
-    validate_line_mappings(line_mappings)
+    a read-only view of the rawtext of a mapped line, that only decodes
+    the line's values and builds the dict of them when first accessed.
+    The line must not be modified after mapping.
+    """
+    __slots__ = ('plan', 'line', 'rawtext')
+
+    def __init__(self, plan, line):
+        self.plan = plan
+        self.line = line
+        self.rawtext = None
+
+    def materialise(self):
+        """
+        returns the dict of raw values, building it if need be.
+        """
+        if self.rawtext is None:
+            rawtext = {}
+            for column, raw_value in zip(self.plan.columns, self.line):
+                if not isinstance(column, ColumnPlan):
+                    continue
+
+                for decoder in column.decode:
+                    raw_value = decoder(raw_value)
+
+                rawtext[column.rawtext_name] = raw_value
+
+            self.rawtext = rawtext
 
-    rawtext = {}
-    data = {}
+        return self.rawtext
 
-    for col, raw_value in enumerate(line):
-        column_mapping = line_mappings[col]
-        if not column_mapping:
-            raise Exception('Wrong number of columns')
+    def __getitem__(self, name):
+        return self.materialise()[name]
 
-        if column_mapping.get('do_not_capture'):
+    def __iter__(self):
+        return iter(self.materialise())
+
+    def __len__(self):
+        return len(self.materialise())
+
+    def __repr__(self):
+        return repr(self.materialise())
+
+def pruned_columns(columns, fields, rawtext=True):
+    """
+    returns a plan's `columns` with only the field plans that map to one
+    of `fields` (so including all of their priorities and orders), and
+    None for columns left with nothing to do. Columns whose rawtext is
+    selected by name in `rawtext` are kept for it.
+    """
+    pruned = []
+    for column in columns:
+        if not isinstance(column, ColumnPlan):
+            pruned.append(column)
             continue
 
-        if 'standard_mapping' in column_mapping:
-            column_mapping = standard_mapping(column_mapping['standard_mapping'], column_mapping)
+        kept = tuple(field_plan for field_plan in column.fields if field_plan.field in fields)
+        if kept or (isinstance(rawtext, frozenset) and column.rawtext_name in rawtext):
+            pruned.append(column._replace(fields=kept))
+        else:
+            pruned.append(None)
 
-        rawtext_column_name = (column_mapping.get('rawtext_name') or
-                               column_mapping['column']).lower()
+    return pruned
 
-        for encoding in column_mapping.get('decode', []):
-            raw_value = decode_raw_value(raw_value, encoding)
+FieldPlan = namedtuple('FieldPlan', [
+    'field', 'field_mapping', 'replaces', 'convert', 'validations', 'join', 'order',
+    'priority', 'compact'
+])
 
-        rawtext[rawtext_column_name] = raw_value
+class MappingPlan:
+    """
+    an immutable, pre-validated form of some `line_mappings`,
+    as returned by `compile_mapping`. Standard mappings are merged
+    and rawtext names resolved once, rather than for every line.
 
-        for field_mapping in column_mapping.get('mappings', []):
-            original_value = raw_value
+    `rawtext` controls rawtext capture: True (all columns), False (none),
+    'lazy' (see `LazyRawtext`), or a collection of rawtext names to capture.
+    `column_names` are the header names of the columns, if known.
+    """
+    __slots__ = ('columns', 'layout', 'rawtext', 'column_names', '__weakref__')
+
+    def __init__(self, columns, rawtext=True, column_names=None):
+        if rawtext not in (True, False, 'lazy'):
+            rawtext = frozenset(name.lower() for name in rawtext)
+
+        columns = tuple(
+            column._replace(capture_rawtext=rawtext is True or
+                            (isinstance(rawtext, frozenset) and column.rawtext_name in rawtext))
+            if isinstance(column, ColumnPlan) else column
+            for column in columns
+        )
+
+        object.__setattr__(self, 'columns', columns)
+        object.__setattr__(self, 'layout', compile_layout(columns))
+        object.__setattr__(self, 'rawtext', rawtext)
+        object.__setattr__(self, 'column_names',
+                           None if column_names is None else tuple(column_names))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('MappingPlan is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('MappingPlan is immutable')
+
+    def derived(self, columns, column_names=None):
+        """
+        returns a plan of the same kind as this one, but with the given
+        `columns` (e.g. reordered). Subclasses carry their own state over.
+        """
+        return MappingPlan(columns, self.rawtext, column_names)
+
+    def reordered(self, indices):
+        """
+        returns a plan for lines whose columns are those of this
+        plan at `indices` (e.g. as ordered by a file's header).
+        """
+        column_names = self.column_names
+        if column_names is not None:
+            column_names = [column_names[index] for index in indices]
+
+        return self.derived([self.columns[index] for index in indices], column_names)
+
+    def pruned(self, fields):
+        """
+        returns a plan that only maps the given `fields`, skipping the
+        columns (and so their decoding, rawtext and validations) that
+        none of them need. Raises if any of `fields` isn't mapped.
+        The plan is of the same kind as this one (see `derived`).
+        """
+        fields = frozenset(fields)
+
+        unknown = fields.difference(self.layout.fields)
+        if unknown:
+            raise Exception('Unknown field(s): %s' % ', '.join(sorted(unknown)))
+
+        return self.derived(pruned_columns(self.columns, fields, self.rawtext), self.column_names)
+
+    def memo_stats(self):
+        """
+        returns the cache stats of each memoized field mapping,
+        as a list of dicts including the column and field.
+        """
+        stats = []
+        for column in self.columns:
+            if not isinstance(column, ColumnPlan):
+                continue
 
-            original_value = replace_before_mapping(original_value, field_mapping)
-            value = mapped_value(original_value, field_mapping)
-            validations = field_mapping.get('validates')
-            if validations:
-                apply_validations_on(field_mapping['field'], value, validations)
+            for field_plan in column.fields:
+                if isinstance(field_plan.convert, MemoizedConverter):
+                    stats.append(dict(column=column.rawtext_name, field=field_plan.field,
+                                      **field_plan.convert.stats()))
+
+        return stats
+
+    def validate(self, col, field_plan, value):
+        """
+        raises if the value mapped for `field_plan` (of column `col`)
+        fails its validations; subclasses can override this to observe
+        the plan's validations.
+        """
+        apply_validations_on(field_plan.field, value, field_plan.validations)
+
+    def invalid_rule(self, col, field_plan, value):
+        """
+        returns the rule the value mapped for `field_plan` (of column `col`)
+        fails, or None, without raising; the counterpart of `validate`.
+        """
+        return failed_rule(value, field_plan.validations)
+
+    def map_values(self, line, on_invalid=None):
+        """
+        decodes and maps each value of `line`, returning a list of its
+        mapped values by slot (see `RecordLayout`), with `_NOT_SET` where
+        blank, and a list of its captured raw values by column. This is
+        the walk of the columns and field mappings that mapping a line,
+        in any form, is built on.
+
+        A failed validation raises a `ValidationError`, unless `on_invalid`
+        is given, in which case it is called with the column index, field
+        and failed rule instead (so nothing is raised for invalid rows),
+        and the field's value is skipped.
+        """
+        columns = self.columns
+        layout = self.layout
+        validate = self.validate
+        invalid_rule = self.invalid_rule
+        slot_values = [_NOT_SET] * layout.slot_count
+        raw_values = [_NOT_SET] * len(columns)
+
+        for col, raw_value in enumerate(line):
+            column = columns[col]
+            if column is _INVALID_COLUMN:
+                raise Exception('Wrong number of columns')
+
+            if column is None:
+                continue
 
-            if isblank(value) and not field_mapping.get('join'):
+            for decoder in column.decode:
+                raw_value = decoder(raw_value)
+
+            if column.capture_rawtext:
+                raw_values[col] = raw_value
+
+            for field_plan, slot in zip(column.fields, layout.slots[col]):
+                original_value = raw_value
+                if field_plan.replaces and original_value:
+                    for compiled_replaces in field_plan.replaces:
+                        original_value = apply_compiled_replaces(original_value, compiled_replaces)
+
+                value = field_plan.convert(original_value)
+                if field_plan.validations:
+                    if on_invalid is None:
+                        validate(col, field_plan, value)
+                    else:
+                        rule = invalid_rule(col, field_plan, value)
+                        if rule is not None:
+                            on_invalid(col, field_plan.field, rule)
+                            continue
+
+                if isblank(value) and not field_plan.join:
+                    continue
+
+                slot_values[slot] = value
+
+        return slot_values, raw_values
+
+    def record(self, line, slot_values, raw_values):
+        """
+        returns the `MappedRecord` of `line`, given its `map_values`.
+        """
+        if self.rawtext == 'lazy':
+            raw_values = LazyRawtext(self, line)
+        elif self.rawtext is False:
+            raw_values = None
+
+        return MappedRecord(self.layout, record_values(self.layout, slot_values), raw_values)
+
+    def map_line(self, line):
+        """
+        applies the compiled mapping to the given line.
+        """
+        return self.record(line, *self.map_values(line)).to_dict()
+
+    def map_record(self, line):
+        """
+        applies the compiled mapping to the given line, returning a
+        `MappedRecord` rather than an attributes dict.
+        """
+        return self.record(line, *self.map_values(line))
+
+    def map_columns(self, columns):
+        """
+        applies the compiled mapping to whole columns at once, returning
+        a dict of field columns (with None where a row has no value), plus
+        a 'rawtext' dict of the captured raw columns (eagerly, even if lazy).
+        """
+        columns = [list(column) for column in columns]
+        row_count = len(columns[0]) if columns else 0
+        rawtext = {}
+        contributions = [] # (field_plan, mapped values) in mapping order
+        invalid = None # The (row, error) of the first row that fails validation
+
+        for col, raw_values in enumerate(columns):
+            column = self.columns[col]
+            if column is _INVALID_COLUMN:
+                raise Exception('Wrong number of columns')
+
+            if column is None:
                 continue
 
-            field = field_mapping.get('field')
+            if len(raw_values) != row_count:
+                raise Exception('Columns must all be the same length')
 
-            data[field] = data.get(field, {})
-            data[field]['values'] = data[field].get('values', {})
-            if 'compact' not in data[field]:
-                data[field]['compact'] = True
+            for decoder in column.decode:
+                raw_values = [decoder(raw_value) for raw_value in raw_values]
 
-            if field_mapping.get('order'):
-                data[field]['join'] = data[field].get('join', field_mapping.get('join'))
+            if column.capture_rawtext or self.rawtext == 'lazy':
+                rawtext[column.rawtext_name] = raw_values
 
-                if 'compact' in field_mapping:
-                    data[field]['compact'] = field_mapping['compact']
+            for field_plan in column.fields:
+                values = mapped_unique_values(raw_values, field_plan_converter(field_plan))
 
-                data[field]['values'][field_mapping['order'] - 1] = value
-            elif field_mapping.get('priority'):
-                data[field]['values'][field_mapping['priority']] = value
-            else:
-                data[field]['values'][0] = value
+                if field_plan.validations:
+                    # Only earlier rows can fail first, as they would when mapped by line:
+                    last_row = invalid[0] - 1 if invalid else row_count
+                    for row, value in enumerate(values[:last_row], 1):
+                        try:
+                            self.validate(col, field_plan, value)
+                        except Exception as error:
+                            invalid = (row, error)
+                            break
+
+                contributions.append((field_plan, values))
+
+        if invalid is not None:
+            row, error = invalid
+            raise MappingError(row, error) from error
+
+        fields = {}
+        for field_plan, _ in contributions:
+            fields.setdefault(field_plan.field, [None] * row_count)
+
+        for row in range(row_count):
+            data = {}
+
+            for field_plan, values in contributions:
+                value = values[row]
+                if isblank(value) and not field_plan.join:
+                    continue
+
+                collect_value(data, field_plan, value)
+
+            for field, field_data in data.items():
+                fields[field][row] = field_value(field_data)
+
+        if self.rawtext is not False:
+            fields['rawtext'] = rawtext # Assign last
+
+        return fields
+
+MEMO_SIZE = 1024
+MEMO_WINDOW = 10000
+MEMO_MIN_HIT_RATE = 0.5
+
+class MemoizedConverter:
+    """
+    wraps a field plan's converter with a bounded LRU cache of results,
+    for low-cardinality columns. Every `window` lookups the hit rate is
+    checked, and if it is below `min_hit_rate` (e.g. for NHS numbers)
+    the cache is dropped and the converter is simply called from then on.
+    """
+    __slots__ = ('function', 'maxsize', 'window', 'min_hit_rate', 'cache',
+                 'enabled', 'hits', 'misses', 'window_hits', 'window_lookups')
+
+    def __init__(self, function, maxsize=MEMO_SIZE, window=MEMO_WINDOW,
+                 min_hit_rate=MEMO_MIN_HIT_RATE):
+        self.function = function
+        self.maxsize = maxsize
+        self.window = window
+        self.min_hit_rate = min_hit_rate
+        self.cache = OrderedDict()
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.window_hits = 0
+        self.window_lookups = 0
+
+    def __call__(self, value):
+        if not self.enabled:
+            return self.function(value)
+
+        cache = self.cache
+        try:
+            result = cache[value]
+            cache.move_to_end(value)
+            self.hits += 1
+            self.window_hits += 1
+        except KeyError:
+            result = self.function(value)
+            cache[value] = result
+            if len(cache) > self.maxsize:
+                cache.popitem(last=False)
+            self.misses += 1
+        except TypeError: # unhashable, e.g. a list of values
+            return self.function(value)
+
+        self.window_lookups += 1
+        if self.window_lookups >= self.window:
+            if self.window_hits < self.window_lookups * self.min_hit_rate:
+                self.enabled = False
+                self.cache = OrderedDict()
+
+            self.window_hits = self.window_lookups = 0
+
+        return result
+
+    def stats(self):
+        """
+        returns the hits, misses, size and state of the cache.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.cache),
+            'enabled': self.enabled
+        }
+
+def column_name(column_mapping):
+    """
+    returns the name of the column that the mapping expects
+    to find in a header, including via any standard mapping.
+    """
+    name = column_mapping.get('column')
+
+    if not name and 'standard_mapping' in column_mapping:
+        name = standard_mappings().get(column_mapping['standard_mapping'], {}).get('column')
+
+    return name
+
+def compile_column(column_mapping, memoize=False):
+    """
+    resolves a single column mapping into a `ColumnPlan`, or
+    `None` if the column is not to be captured. If `memoize`,
+    each field's replaces and value mapping are memoized together.
+    """
+    if not column_mapping:
+        return _INVALID_COLUMN
+
+    if column_mapping.get('do_not_capture'):
+        return None
+
+    if 'standard_mapping' in column_mapping:
+        column_mapping = standard_mapping(column_mapping['standard_mapping'], column_mapping)
+
+    rawtext_name = (column_mapping.get('rawtext_name') or column_mapping['column']).lower()
+
+    fields = []
+    for field_mapping in column_mapping.get('mappings', []):
+        replaces = field_mapping.get('replace', [])
+        if not isinstance(replaces, list):
+            replaces = [replaces]
+
+        if 'match' in field_mapping:
+            compiled_pattern(field_mapping['match']) # Warm the cache ahead of use
+
+        field_plan = FieldPlan(
+            field=field_mapping.get('field'),
+            field_mapping=field_mapping,
+            replaces=tuple(compile_replaces(reps) for reps in replaces),
+            convert=value_converter(field_mapping),
+            validations=field_mapping.get('validates'),
+            join=field_mapping.get('join'),
+            order=field_mapping.get('order'),
+            priority=field_mapping.get('priority'),
+            compact=field_mapping.get('compact', _NOT_SET)
+        )
+
+        if memoize:
+            field_plan = field_plan._replace(
+                replaces=(),
+                convert=MemoizedConverter(field_plan_converter(field_plan))
+            )
+
+        fields.append(field_plan)
+
+    decode = tuple(value_decoder(encoding) for encoding in column_mapping.get('decode', []))
+
+    return ColumnPlan(rawtext_name, decode, tuple(fields), True)
+
+def compile_mapping(line_mappings, memoize=False, rawtext=True, fields=None):
+    """
+    validates the supplied `line_mappings` once, and returns
+    a `MappingPlan` that can be used to map any number of lines.
+    An already compiled plan is returned as is (unless `fields` is given).
+
+    If `memoize`, results are cached for each field mapping (see
+    `MemoizedConverter`); `plan.memo_stats()` reports on the caches.
+    `rawtext` controls which raw values are captured (see `MappingPlan`).
+    If `fields` is given, only those fields are mapped (see `MappingPlan.pruned`).
+    """
+    if isinstance(line_mappings, MappingPlan):
+        plan = line_mappings
+    else:
+        validate_line_mappings(line_mappings)
+
+        line_mappings = copy.deepcopy(line_mappings)
+
+        columns = [compile_column(column_mapping, memoize) for column_mapping in line_mappings]
+
+        plan = MappingPlan(columns, rawtext, [column_name(column_mapping)
+                                              for column_mapping in line_mappings])
+
+    return plan if fields is None else plan.pruned(fields)
+
+PLAN_CACHE_SIZE = 32
+
+_plan_cache = OrderedDict()
+
+def cached_plan(line_mappings):
+    """
+    returns a compiled plan for `line_mappings`, reusing a previous
+    compilation of the very same object. Mappings are assumed not
+    to be mutated once they have been used.
+    """
+    if isinstance(line_mappings, MappingPlan):
+        return line_mappings
 
-    attributes = {}
+    key = id(line_mappings)
+    entry = _plan_cache.get(key)
 
-    for field, field_data in data.items():
-        # Stored in a dict by "index", retrieve sorted actual values:
-        value_dict = field_data['values']
-        values = list(map(lambda k: value_dict[k], sorted(value_dict)))
+    # The stored reference keeps `id` from being reused while cached:
+    if entry is not None and entry[0] is line_mappings:
+        _plan_cache.move_to_end(key)
+        return entry[1]
 
-        if 'join' in field_data:
-            # Map "blank" values to None:
-            values = map(lambda v: v or None, values)
+    plan = compile_mapping(line_mappings)
 
-            if field_data['compact']:
-                values = list(filter(None, values))
+    _plan_cache[key] = (line_mappings, plan)
+    while len(_plan_cache) > PLAN_CACHE_SIZE:
+        _plan_cache.popitem(last=False)
 
-            attributes[field] = field_data['join'].join(map(lambda v: v or '', values))
+    return plan
+
+def mapped_line(line, line_mappings):
+    """
+    applies mapping to the given line.
+    """
+    return cached_plan(line_mappings).map_line(line)
+
+def map_columns(columns, line_mappings, fields=None):
+    """
+    applies mapping to a list of columns (any sequences, e.g. lists,
+    NumPy arrays or pandas Series), returning field and rawtext columns.
+    If `fields` is given, only those fields are mapped (and validated).
+    """
+    plan = cached_plan(line_mappings)
+    if fields is not None:
+        plan = plan.pruned(fields)
+
+    return plan.map_columns(columns)
+
+def mapped_batch(map_line, first_row, lines):
+    """
+    maps a batch of lines, numbered from `first_row`, returning a list
+    of (attributes, error) pairs so that one bad row doesn't lose the
+    rest of the batch.
+    """
+    results = []
+
+    for row, line in enumerate(lines, first_row):
+        try:
+            results.append((map_line(line), None))
+        except Exception as error:
+            results.append((None, MappingError(row, error)))
+
+    return results
+
+def batch_results(results, on_error=None):
+    """
+    yields the mapped attributes from a batch's results, raising
+    each error (or passing it to `on_error`, if given).
+    """
+    for attributes, error in results:
+        if error is None:
+            yield attributes
+        elif on_error is None:
+            raise error
         else:
-            attributes[field] = next((v for v in values), None)
+            on_error(error)
 
-    attributes['rawtext'] = rawtext # Assign last
+class MappingError(Exception):
+    """
+    raised (or reported) when an individual row fails to map,
+    recording the row number (counted from 1) and the cause.
+    """
+    def __init__(self, row, cause):
+        super().__init__('row %d: %s' % (row, cause))
+        self.row = row
+        self.cause = cause
 
-    return attributes
+    def __reduce__(self):
+        return (MappingError, (self.row, self.cause))
+
+def mapped_lines(lines, line_mappings, on_error=None, records=False, fields=None):
+    """
+    lazily applies mapping to each line pulled from the iterable `lines`,
+    yielding one attributes dict (or `MappedRecord`, if `records`) at a time.
+    If `fields` is given, only those fields are mapped (and validated).
+
+    A row that fails to map raises a `MappingError`, unless an `on_error`
+    callable is given, in which case it is passed the `MappingError` and
+    the row is skipped.
+    """
+    plan = compile_mapping(line_mappings, fields=fields)
+    map_line = plan.map_record if records else plan.map_line
+
+    for row, line in enumerate(lines, 1):
+        try:
+            attributes = map_line(line)
+        except Exception as error:
+            if on_error is None:
+                raise MappingError(row, error) from error
+
+            on_error(MappingError(row, error))
+            continue
+
+        yield attributes
 
 STANDARD_MAPPINGS_YAML = """
 surname:
@@ -342,14 +1372,29 @@ test:
   column: standard_mapping_column_name
 """
 
-STANDARD_MAPPINGS = yaml.load(STANDARD_MAPPINGS_YAML, Loader=yaml.FullLoader)
+@lru_cache(maxsize=None)
+def standard_mappings():
+    """
+    returns the standard mappings, parsing them on first use
+    rather than at import.
+    """
+    from mapper.loading import parse_mapping # Imports mapper itself
+
+    return parse_mapping(STANDARD_MAPPINGS_YAML)
+
+def __getattr__(name):
+    # Keeps `mapper.STANDARD_MAPPINGS` working, while loading it lazily:
+    if name == 'STANDARD_MAPPINGS':
+        return standard_mappings()
+
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 def standard_mapping(mapping_name, column_mapping):
     """
     Looks for a standard mapping matching the given name,
     and merges it into the supplied column mapping.
     """
-    mapping = STANDARD_MAPPINGS.get(mapping_name)
+    mapping = standard_mappings().get(mapping_name)
     if not mapping:
         return None
 
@@ -382,5 +1427,5 @@ if __name__ == "__main__":
         ['gob', 'Peterborough Hospital']
     ]
 
-    for l in LINES:
-        print(mapped_line(l, MAPPING))
+    for attributes in mapped_lines(LINES, MAPPING):
+        print(attributes)
@@ -0,0 +1,84 @@
+"""
+Maps lines from asynchronous sources, for use within an asyncio event loop.
+
+Primarily defines:
+
+    async for attributes in amapped_lines(async_lines, line_mappings):
+        ...
+"""
+
+import asyncio
+
+from mapper import batch_results, compile_mapping, mapped_batch
+
+BATCH_SIZE = 500
+
+async def abatches(lines, batch_size):
+    """
+    yields lists of up to `batch_size` lines from the async iterable `lines`.
+    """
+    batch = []
+
+    async for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+async def aqueue_lines(queue, sentinel=None):
+    """
+    yields lines from an `asyncio.Queue` until `sentinel` is received.
+    """
+    while True:
+        line = await queue.get()
+        if line is sentinel:
+            return
+
+        yield line
+
+async def amapped_lines(lines, line_mappings, batch_size=BATCH_SIZE, executor=None,
+                        on_error=None, records=False, fields=None):
+    """
+    lazily applies mapping to lines from the async iterable `lines`,
+    yielding results as `mapped_lines` does.
+
+    Lines are only pulled from the source as results are consumed, in
+    batches of `batch_size`. Without an `executor`, each batch is mapped
+    on the event loop, which is yielded to between batches. Otherwise each
+    batch is mapped in the executor (e.g. a `ThreadPoolExecutor`), while the
+    next batch is read, so the loop is never stalled by a batch's mapping.
+    If `fields` is given, only those fields are mapped (and validated).
+    """
+    plan = compile_mapping(line_mappings, fields=fields)
+    map_line = plan.map_record if records else plan.map_line
+    loop = asyncio.get_running_loop()
+
+    first_row = 1
+    pending = None
+
+    async for batch in abatches(lines, batch_size):
+        if executor is None:
+            results = mapped_batch(map_line, first_row, batch)
+            first_row += len(batch)
+
+            for attributes in batch_results(results, on_error):
+                yield attributes
+
+            await asyncio.sleep(0) # Let other tasks run between batches
+            continue
+
+        future = loop.run_in_executor(executor, mapped_batch, map_line, first_row, batch)
+        first_row += len(batch)
+
+        if pending is not None:
+            for attributes in batch_results(await pending, on_error):
+                yield attributes
+
+        pending = future
+
+    if pending is not None:
+        for attributes in batch_results(await pending, on_error):
+            yield attributes
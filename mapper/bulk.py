@@ -0,0 +1,142 @@
+"""
+Error-tolerant bulk mapping. Rows that fail validation are recorded in
+a compact error log, rather than raising, and mapping carries on until
+an optional error budget is spent.
+
+Primarily defines:
+
+    errors = ErrorLog(budget=1000)
+    bulk_mapped_lines(lines, line_mappings, errors)
+    errors.summary()
+"""
+
+from collections import Counter, namedtuple
+import logging
+
+from mapper import _INVALID_COLUMN, compile_mapping
+
+logger = logging.getLogger(__name__)
+
+RowError = namedtuple('RowError', ['row', 'field', 'rule', 'value'])
+
+class ErrorBudgetExceeded(Exception):
+    """
+    raised when more rows have failed than an `ErrorLog`'s budget allows.
+    """
+
+class ErrorLog:
+    """
+    collects a `RowError` (row number, field, rule and raw value) for each
+    failure while bulk mapping. Rows that could not be mapped at all are
+    recorded with the rule 'columns' (too many columns) or 'error' (with
+    the exception's message as the value).
+
+    `budget` is the number of failed rows tolerated (None for no limit).
+    """
+    __slots__ = ('budget', 'entries', 'rows', 'failed_rows')
+
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.entries = []
+        self.rows = 0
+        self.failed_rows = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def summary(self):
+        """
+        returns the counts of rows mapped and failed, and
+        of errors by (field, rule).
+        """
+        return {
+            'rows': self.rows,
+            'failed_rows': self.failed_rows,
+            'errors': Counter((entry.field, entry.rule) for entry in self.entries)
+        }
+
+    def report(self):
+        """
+        returns the summary as text, one line per (field, rule).
+        """
+        lines = ['%d of %d rows failed' % (self.failed_rows, self.rows)]
+        for (field, rule), count in sorted(self.summary()['errors'].items(), key=str):
+            lines.append('  %s %s: %d' % (field or '(row)', rule, count))
+
+        return '\n'.join(lines)
+
+def mappable_width(plan):
+    """
+    returns how many columns a line can have for `plan` to map it.
+    """
+    for col, column in enumerate(plan.columns):
+        if column is _INVALID_COLUMN:
+            return col
+
+    return len(plan.columns)
+
+def logged_map_line(plan, line, row, entries, width=None):
+    """
+    maps `line` as `plan.map_line` does, except that a `RowError` is
+    appended to `entries` for each failed validation (or a wrong number
+    of columns, more than `width`), rather than raising, and None is
+    returned instead.
+    """
+    if line.__class__ is not list and line.__class__ is not tuple:
+        line = list(line)
+
+    if len(line) > (mappable_width(plan) if width is None else width):
+        entries.append(RowError(row, None, 'columns', len(line)))
+        return None
+
+    failed = []
+
+    def on_invalid(col, field, rule):
+        failed.append(RowError(row, field, rule, line[col]))
+
+    slot_values, raw_values = plan.map_values(line, on_invalid)
+
+    if failed:
+        entries.extend(failed)
+        return None
+
+    return plan.record(line, slot_values, raw_values).to_dict()
+
+def bulk_mapped_lines(lines, line_mappings, errors, first_row=1, fields=None):
+    """
+    lazily applies mapping to each line pulled from `lines`, yielding
+    attributes dicts for the rows that map, and recording failures in the
+    `ErrorLog` `errors`. Raises `ErrorBudgetExceeded` once more rows have
+    failed than its budget allows; otherwise logs a summary at the end.
+    If `fields` is given, only those fields are mapped (and validated).
+    """
+    plan = compile_mapping(line_mappings, fields=fields)
+    width = mappable_width(plan)
+    entries = errors.entries
+    budget = errors.budget
+    row = first_row - 1
+
+    try:
+        for row, line in enumerate(lines, first_row):
+            try:
+                attributes = logged_map_line(plan, line, row, entries, width)
+            except Exception as error: # e.g. undecodable, rather than invalid
+                entries.append(RowError(row, None, 'error', str(error)))
+                attributes = None
+
+            if attributes is None:
+                errors.failed_rows += 1
+                if budget is not None and errors.failed_rows > budget:
+                    raise ErrorBudgetExceeded('error budget of %d rows exceeded at row %d' %
+                                              (budget, row))
+                continue
+
+            yield attributes
+    finally:
+        errors.rows += row - first_row + 1
+
+    if errors.failed_rows:
+        logger.warning(errors.report())
@@ -0,0 +1,177 @@
+"""
+Maps a file to JSON Lines, periodically checkpointing how far it has
+got, so that a long-running job can resume after a crash rather than
+starting again from the first row.
+
+Primarily defines:
+
+    map_file_resumable(path, line_mappings, output, checkpoint)
+"""
+
+import json
+import os
+import tempfile
+
+from mapper import compile_mapping, MappingPlan
+from mapper.bulk import bulk_mapped_lines, ErrorLog
+from mapper.loading import mapping_hash
+from mapper.readers import file_lines, mapping_for_header
+from mapper.sharding import serialised
+
+CHECKPOINT_INTERVAL = 10000
+CHECKPOINT_VERSION = 1
+
+def read_checkpoint(path):
+    """
+    returns the checkpoint saved at `path`, or None if there isn't one.
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            checkpoint = json.load(file)
+    except FileNotFoundError:
+        return None
+
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        raise Exception('checkpoint %s is from an incompatible version!' % path)
+
+    return checkpoint
+
+def write_checkpoint(path, checkpoint, durable=True):
+    """
+    atomically replaces the checkpoint saved at `path`.
+    """
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                             suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            json.dump(dict(checkpoint, version=CHECKPOINT_VERSION), file)
+            if durable:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def tracked_lines(file, state, encoding='utf-8'):
+    """
+    yields each line of text from the binary `file`, keeping
+    state['offset'] at the byte offset just after it.
+    """
+    for line in file:
+        state['offset'] += len(line)
+        yield line.decode(encoding)
+
+def counted_lines(lines, state):
+    """
+    yields each of `lines`, keeping state['row'] at its row number.
+    """
+    for line in lines:
+        state['row'] += 1
+        yield line
+
+def opened_output(path, position):
+    """
+    returns `path` opened for binary writing, truncated to `position`
+    (that of the last checkpoint), or emptied if `position` is None.
+    """
+    if position is None:
+        return open(path, 'wb')
+
+    file = open(path, 'r+b')
+    file.truncate(position)
+    file.seek(position)
+    return file
+
+def map_file_resumable(path, line_mappings, output, checkpoint, errors_output=None,
+                       format='csv', header=True, widths=None, encoding='utf-8',
+                       interval=CHECKPOINT_INTERVAL, budget=None, durable=True,
+                       memoize=False, rawtext=True, profiler=None, fields=None):
+    """
+    maps the file at `path` in bulk (see `bulk_mapped_lines`), writing the
+    attributes to `output`, and any errors to `errors_output`, as JSON Lines.
+    `line_mappings` is compiled as `compile_mapping` does with `memoize`,
+    `rawtext` and `fields`, and instrumented by the `MappingProfiler`
+    `profiler`, if given.
+
+    Every `interval` rows, the input offset, row, output positions and a
+    hash of `line_mappings` (which must not be a compiled plan), `rawtext`
+    and `fields` are saved to the file `checkpoint`, which is removed once the whole file
+    is mapped. If it exists when called, mapping resumes from it, unless the
+    mapping has changed, in which case this raises. Unless `durable` is
+    False, output is synced to disk before each checkpoint is saved.
+
+    Returns the total rows and failed rows, and the row resumed from.
+    """
+    if isinstance(line_mappings, MappingPlan):
+        raise Exception('Resumable mapping needs the mapping itself, not a compiled plan!')
+
+    plan = compile_mapping(line_mappings, memoize, rawtext, fields) # Raises before any output
+    digest = mapping_hash([line_mappings, plan.rawtext,
+                           None if fields is None else frozenset(fields)])
+    if profiler is not None:
+        plan = profiler.instrument(plan)
+
+    saved = read_checkpoint(checkpoint)
+    if saved is not None and saved['mapping'] != digest:
+        raise Exception('mapping has changed since checkpoint %s was saved; '
+                        'not resuming!' % checkpoint)
+
+    state = {'offset': 0, 'row': 0}
+    errors = ErrorLog(budget)
+
+    with open(path, 'rb') as file:
+        lines = file_lines(tracked_lines(file, state, encoding), format, widths, encoding)
+
+        if header:
+            first = next(lines, None)
+            if first is not None:
+                plan = mapping_for_header(first, plan)
+
+        if saved is not None:
+            file.seek(saved['input_offset'])
+            state.update(offset=saved['input_offset'], row=saved['row'])
+            errors.rows = saved['row']
+            errors.failed_rows = saved['failed_rows']
+
+        resumed_from = state['row']
+
+        with opened_output(output, saved and saved['output_position']) as output_file, \
+             opened_output(errors_output or os.devnull,
+                           saved and errors_output and saved['errors_position']) as errors_file:
+
+            def save():
+                for entry in errors.entries:
+                    errors_file.write(json.dumps(entry, default=serialised).encode('utf-8') + b'\n')
+                del errors.entries[:]
+
+                for out in (output_file, errors_file):
+                    out.flush()
+                    if durable and out.name != os.devnull:
+                        os.fsync(out.fileno())
+
+                write_checkpoint(checkpoint, {
+                    'mapping': digest,
+                    'input_offset': state['offset'],
+                    'row': state['row'],
+                    'failed_rows': errors.failed_rows,
+                    'output_position': output_file.tell(),
+                    'errors_position': errors_file.tell()
+                }, durable)
+
+            next_checkpoint = state['row'] + interval
+
+            for attributes in bulk_mapped_lines(counted_lines(lines, state), plan,
+                                                errors, state['row'] + 1):
+                output_file.write(json.dumps(attributes, default=serialised).encode('utf-8'))
+                output_file.write(b'\n')
+
+                if state['row'] >= next_checkpoint:
+                    save()
+                    next_checkpoint = state['row'] + interval
+
+            save()
+
+    os.unlink(checkpoint)
+
+    return {'rows': state['row'], 'failed_rows': errors.failed_rows, 'resumed_from': resumed_from}
@@ -0,0 +1,228 @@
+"""
+Generates a specialised Python function for a mapping, that does
+the work of `MappingPlan.map_line` as straight-line code: no looping
+over columns, and no lookups of mapping config for each value.
+
+Primarily defines:
+
+    map_line = generated_map_line(line_mappings)
+    map_line(line) # => the same as mapped_line(line, line_mappings)
+"""
+
+from weakref import WeakKeyDictionary
+
+from mapper import _INVALID_COLUMN, _NOT_SET, apply_compiled_replaces, apply_validations_on, \
+                   cached_plan, cleaners_for, compiled_pattern, isblank, joined_value, \
+                   LazyRawtext, MappingPlan, MemoizedConverter, parse_date
+
+_generated = WeakKeyDictionary()
+
+class Emitter:
+    """
+    accumulates the lines of generated source, and the
+    constants that they refer to by name.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.namespace = {
+            'NOT_SET': _NOT_SET,
+            'LazyRawtext': LazyRawtext,
+            'apply_compiled_replaces': apply_compiled_replaces,
+            'apply_validations_on': apply_validations_on,
+            'isblank': isblank,
+            'joined_value': joined_value,
+            'parse_date': parse_date
+        }
+
+    def emit(self, indent, line):
+        self.lines.append('    ' * indent + line)
+
+    def constant(self, prefix, value):
+        """
+        returns the name by which generated code can refer to `value`.
+        """
+        name = '%s_%d' % (prefix, len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def source(self):
+        return '\n'.join(self.lines) + '\n'
+
+def blank(name):
+    """
+    returns an expression equivalent to `isblank(<name>)`,
+    avoiding the function call for strings.
+    """
+    return '(not {0} or ({0}.isspace() if {0}.__class__ is str else isblank({0})))'.format(name)
+
+def emit_convert(emitter, indent, field_plan):
+    """
+    emits code applying a field plan's value mapping to `v`, following
+    the same precedence of directives as `mapped_value`.
+    """
+    field_mapping = field_plan.field_mapping
+
+    if isinstance(field_plan.convert, MemoizedConverter):
+        emitter.emit(indent, 'v = %s(v)' % emitter.constant('convert', field_plan.convert))
+    elif 'format' in field_mapping:
+        date_format = emitter.constant('date_format', field_mapping['format'])
+        emitter.emit(indent, 'v = None if %s else parse_date(v, %s)' % (blank('v'), date_format))
+    elif 'clean' in field_mapping:
+        for cleaner in cleaners_for(field_mapping['clean']):
+            emitter.emit(indent, 'v = %s(v)' % emitter.constant('clean', cleaner))
+    elif 'map' in field_mapping:
+        emitter.emit(indent, 'v = %s.get(v, v)' % emitter.constant('map', field_mapping['map']))
+    elif 'match' in field_mapping:
+        search = emitter.constant('search', compiled_pattern(field_mapping['match']).search)
+        emitter.emit(indent, 'm = %s(v)' % search)
+        emitter.emit(indent, 'v = m and m.group(1)')
+    elif 'daysafter' in field_mapping:
+        emitter.emit(indent, 'v = %s(v)' % emitter.constant('convert', field_plan.convert))
+    else:
+        emitter.emit(indent, 'if %s:' % blank('v'))
+        emitter.emit(indent + 1, 'v = None')
+        emitter.emit(indent, 'elif isinstance(v, str):')
+        emitter.emit(indent + 1, 'v = v.strip()')
+
+def emit_field_plan(emitter, indent, field_plan, slot):
+    """
+    emits code mapping `raw` by the field plan into slot variable `s<slot>`.
+    """
+    emitter.emit(indent, 'v = raw')
+
+    if field_plan.replaces:
+        emitter.emit(indent, 'if v:')
+        emitter.emit(indent + 1, 'if v.__class__ is str:')
+        for compiled_replaces in field_plan.replaces:
+            for regex, replacement in compiled_replaces:
+                emitter.emit(indent + 2, 'v = %s(%s, v)' % (
+                    emitter.constant('sub', regex.sub), emitter.constant('replacement', replacement)
+                ))
+        emitter.emit(indent + 1, 'else:')
+        for compiled_replaces in field_plan.replaces:
+            emitter.emit(indent + 2, 'v = apply_compiled_replaces(v, %s)' %
+                         emitter.constant('replaces', compiled_replaces))
+
+    emit_convert(emitter, indent, field_plan)
+
+    if field_plan.validations:
+        emitter.emit(indent, 'apply_validations_on(%s, v, %s)' % (
+            emitter.constant('field', field_plan.field),
+            emitter.constant('validations', field_plan.validations)
+        ))
+
+    if field_plan.join:
+        emitter.emit(indent, 's%d = v' % slot)
+    else:
+        emitter.emit(indent, 'if not %s:' % blank('v'))
+        emitter.emit(indent + 1, 's%d = v' % slot)
+
+def emit_field(emitter, indent, field, groups, ordered):
+    """
+    emits code resolving a field's slot variables into its attribute,
+    as `record_values` does.
+    """
+    key = emitter.constant('field', field)
+    slots = [slot for group in groups for slot in group]
+
+    if not ordered:
+        # The first slot with a value, by priority, wins:
+        for index, slot in enumerate(slots):
+            emitter.emit(indent, '%s s%d is not NOT_SET:' % ('if' if index == 0 else 'elif', slot))
+            emitter.emit(indent + 1, 'attributes[%s] = s%d' % (key, slot))
+        return
+
+    emitter.emit(indent, 'collected = []')
+    for group in groups:
+        for index, slot in enumerate(group):
+            emitter.emit(indent, '%s s%d is not NOT_SET:' % ('if' if index == 0 else 'elif', slot))
+            emitter.emit(indent + 1, 'collected.append(s%d)' % slot)
+
+    emitter.emit(indent, 'if collected:')
+    emitter.emit(indent + 1, 'join = NOT_SET')
+    for index, (slot, join, _) in enumerate(ordered):
+        emitter.emit(indent + 1, '%s s%d is not NOT_SET:' % ('if' if index == 0 else 'elif', slot))
+        emitter.emit(indent + 2, 'join = %s' % emitter.constant('join', join))
+
+    emitter.emit(indent + 1, 'compact = True')
+    compacting = [(slot, compact) for slot, _, compact in reversed(ordered) if compact is not _NOT_SET]
+    for index, (slot, compact) in enumerate(compacting):
+        emitter.emit(indent + 1, '%s s%d is not NOT_SET:' % ('if' if index == 0 else 'elif', slot))
+        emitter.emit(indent + 2, 'compact = %s' % emitter.constant('compact', compact))
+
+    emitter.emit(indent + 1, 'if join is NOT_SET:')
+    emitter.emit(indent + 2, 'attributes[%s] = collected[0]' % key)
+    emitter.emit(indent + 1, 'else:')
+    emitter.emit(indent + 2, 'attributes[%s] = joined_value(collected, join, compact)' % key)
+
+def generate_source(plan):
+    """
+    returns the source of a `map_line(line)` function for the
+    compiled `plan`, and the namespace it must be executed in.
+    """
+    emitter = Emitter()
+    emitter.namespace['PLAN'] = plan
+    layout = plan.layout
+
+    emitter.emit(0, 'def map_line(line):')
+    emitter.emit(1, 'if line.__class__ is not list and line.__class__ is not tuple:')
+    emitter.emit(2, 'line = list(line)')
+    emitter.emit(1, 'n = len(line)')
+    emitter.emit(1, 'rawtext = {}')
+    emitter.emit(1, 'attributes = {}')
+    for slot in range(layout.slot_count):
+        emitter.emit(1, 's%d = NOT_SET' % slot)
+
+    for col, column in enumerate(plan.columns):
+        if column is None:
+            continue
+
+        emitter.emit(1, 'if n > %d:' % col)
+
+        if column is _INVALID_COLUMN:
+            emitter.emit(2, "raise Exception('Wrong number of columns')")
+            continue
+
+        emitter.emit(2, 'raw = line[%d]' % col)
+        for decoder in column.decode:
+            emitter.emit(2, 'raw = %s(raw)' % emitter.constant('decode', decoder))
+
+        if column.capture_rawtext:
+            emitter.emit(2, 'rawtext[%s] = raw' % emitter.constant('name', column.rawtext_name))
+
+        for field_plan, slot in zip(column.fields, layout.slots[col]):
+            emit_field_plan(emitter, 2, field_plan, slot)
+
+    emitter.emit(1, 'if n > %d:' % len(plan.columns))
+    emitter.emit(2, "raise IndexError('tuple index out of range')")
+
+    for field, groups, ordered in zip(layout.fields, layout.groups, layout.ordered):
+        emit_field(emitter, 1, field, groups, ordered)
+
+    if plan.rawtext == 'lazy':
+        emitter.emit(1, "attributes['rawtext'] = LazyRawtext(PLAN, line)")
+    elif plan.rawtext is not False:
+        emitter.emit(1, "attributes['rawtext'] = rawtext")
+
+    emitter.emit(1, 'return attributes')
+
+    return emitter.source(), emitter.namespace
+
+def generated_map_line(line_mappings):
+    """
+    returns a generated function equivalent to `plan.map_line` for the
+    given mapping (or compiled plan), caching it for as long as the
+    compiled plan exists.
+    """
+    plan = cached_plan(line_mappings)
+    if type(plan) is not MappingPlan: # e.g. instrumented, so not to be bypassed
+        return plan.map_line
+
+    map_line = _generated.get(plan)
+    if map_line is None:
+        source, namespace = generate_source(plan)
+        exec(compile(source, '<mapping %x>' % id(plan), 'exec'), namespace)
+        map_line = _generated[plan] = namespace['map_line']
+
+    return map_line
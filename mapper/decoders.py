@@ -0,0 +1,90 @@
+"""
+Decoders for the `decode` directive of column mappings.
+
+Each decoder takes a str or bytes-like value (bytes, bytearray or
+memoryview) and returns the decoded bytes, or str for charsets.
+Where possible, bytes-like values are decoded without being copied.
+"""
+
+import base64
+import binascii
+import gzip
+
+def decode_base64(value):
+    """
+    decodes base64, as `base64.b64decode` would.
+    """
+    return binascii.a2b_base64(value)
+
+def decode_base32(value):
+    """
+    decodes base32.
+    """
+    return base64.b32decode(value)
+
+def decode_hex(value):
+    """
+    decodes hexadecimal (of either case).
+    """
+    return binascii.a2b_hex(value)
+
+def decode_quoted_printable(value):
+    """
+    decodes quoted-printable.
+    """
+    return binascii.a2b_qp(value)
+
+def decode_gzip_base64(value):
+    """
+    decodes gzipped data that has been base64 encoded.
+    """
+    return gzip.decompress(binascii.a2b_base64(value))
+
+DECODERS = {
+    'base64': decode_base64,
+    'base32': decode_base32,
+    'hex': decode_hex,
+    'quoted-printable': decode_quoted_printable,
+    'gzip+base64': decode_gzip_base64
+}
+
+def register_decoder(encoding, decoder):
+    """
+    registers a callable that decodes a single value, for use as
+    `decode: [<encoding>]` in mappings. Mappings compiled before
+    registration are unaffected.
+    """
+    DECODERS[encoding] = decoder
+
+def charset_decoder(charset):
+    """
+    returns a decoder of bytes-like values to text in the given
+    `charset` (e.g. 'utf-8'), or None if it isn't a text encoding.
+    """
+    try:
+        str(b'\0\0\0\0', charset) # Raises LookupError for non-text codecs too
+    except LookupError:
+        return None
+    except UnicodeDecodeError:
+        pass
+
+    def decode(value):
+        if isinstance(value, str):
+            return value
+
+        return str(value, charset)
+
+    return decode
+
+def decoder_for(encoding):
+    """
+    returns the decoder for `encoding` (a registered encoding or a
+    charset, optionally given as a ':symbol'), or raises.
+    """
+    name = encoding.lstrip(':') if isinstance(encoding, str) else encoding
+
+    decoder = DECODERS.get(name) or charset_decoder(name)
+    if decoder is None:
+        raise Exception('encoding %s is not implemented!' % encoding)
+
+    return decoder
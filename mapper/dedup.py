@@ -0,0 +1,201 @@
+"""
+Caches mapped rows on disk in SQLite, keyed by hashes of the mapping and
+of the row, so that rows already mapped in earlier runs (e.g. of heavily
+overlapping monthly extracts) are served from the cache, not re-mapped.
+
+Primarily defines:
+
+    with RowCache('rows.sqlite', max_rows=10000000) as cache:
+        for attributes in cached_mapped_lines(lines, mapping, cache):
+            ...
+        cache.stats()
+
+Cached rows are pickles, so the cache must not be writable by others.
+Rows are keyed by the mapping's content and `ROW_CACHE_VERSION`, not by
+the code of custom cleaners or decoders (see `register_cleaner`), so the
+cache must be cleared if they change what they return.
+"""
+
+import hashlib
+import pickle
+import sqlite3
+
+from mapper import compile_mapping, MappingError, MappingPlan, standard_mapping
+from mapper.loading import mapping_hash
+
+ROW_CACHE_SIZE = 1000000
+WRITE_BATCH = 1000
+
+# Bump whenever the mapper's results change (e.g. a fix to a cleaner or to
+# date parsing), so that rows cached by earlier versions aren't served:
+ROW_CACHE_VERSION = 1
+
+def mapping_digest(line_mappings, fields=None):
+    """
+    returns the key (bytes) of the rows cached for `line_mappings` (only
+    mapping `fields`, if given): a hash of the mapping, with the standard
+    mappings it refers to merged in, the fields, and `ROW_CACHE_VERSION`.
+    """
+    resolved = [
+        standard_mapping(column_mapping['standard_mapping'], column_mapping)
+        if 'standard_mapping' in column_mapping else column_mapping
+        for column_mapping in line_mappings
+    ]
+
+    return bytes.fromhex(mapping_hash([ROW_CACHE_VERSION, resolved,
+                                       None if fields is None else frozenset(fields)]))
+
+class RowCache:
+    """
+    an on-disk cache of mapped rows (attributes dicts), holding at most
+    `max_rows`. Writes, and updates of when rows were last used, are
+    batched into a transaction every `write_batch` rows; when the cache
+    is over its size, the least recently used batches of rows are evicted.
+    Only one process should write to a cache at a time.
+    """
+
+    def __init__(self, path, max_rows=ROW_CACHE_SIZE, write_batch=WRITE_BATCH):
+        self.max_rows = max_rows
+        self.write_batch = write_batch
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS rows '
+                                    '(key BLOB PRIMARY KEY, attributes BLOB NOT NULL, '
+                                    'used INTEGER NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS rows_used ON rows (used)')
+
+        self.size, self.clock = self.connection.execute(
+            'SELECT COUNT(*), COALESCE(MAX(used), 0) FROM rows'
+        ).fetchone()
+        self.pending = {}
+        self.touched = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def key(digest, line):
+        """
+        returns the cache key of `line` when mapped by the mapping
+        with the given `digest` (bytes).
+        """
+        content = pickle.dumps(tuple(line), protocol=pickle.HIGHEST_PROTOCOL)
+        return hashlib.blake2b(content, digest_size=16, key=digest).digest()
+
+    def get(self, key):
+        """
+        returns the attributes cached for `key`, or None.
+        """
+        blob = self.pending.get(key)
+        if blob is None:
+            row = self.connection.execute('SELECT attributes FROM rows WHERE key = ?',
+                                          (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            blob = row[0]
+            self.touched.append(key)
+
+        self.hits += 1
+        return pickle.loads(blob)
+
+    def put(self, key, attributes):
+        """
+        caches `attributes` for `key`, to be written with the next batch.
+        """
+        self.pending[key] = pickle.dumps(attributes, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(self.pending) + len(self.touched) >= self.write_batch:
+            self.flush()
+
+    def flush(self):
+        """
+        writes pending rows and usage, then evicts any excess rows.
+        """
+        if not self.pending and not self.touched:
+            return
+
+        self.clock += 1
+        connection = self.connection
+
+        with connection:
+            before = connection.total_changes
+            connection.executemany('INSERT OR IGNORE INTO rows VALUES (?, ?, ?)',
+                                   ((key, blob, self.clock) for key, blob in self.pending.items()))
+            self.size += connection.total_changes - before
+
+            connection.executemany('UPDATE rows SET used = ? WHERE key = ?',
+                                   ((self.clock, key) for key in self.touched))
+
+            excess = self.size - self.max_rows
+            if excess > 0:
+                connection.execute('DELETE FROM rows WHERE key IN '
+                                   '(SELECT key FROM rows ORDER BY used LIMIT ?)', (excess,))
+                self.size -= excess
+                self.evictions += excess
+
+        self.pending = {}
+        self.touched = []
+
+    def stats(self):
+        """
+        returns the hits, misses, hit rate, size and evictions of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': self.size + len(self.pending),
+            'evictions': self.evictions
+        }
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+def cached_mapped_lines(lines, line_mappings, cache, on_error=None, fields=None):
+    """
+    lazily applies mapping to each line pulled from `lines`, as
+    `mapped_lines` does, but serving rows that have already been mapped
+    with the same mapping (see `mapping_digest`) from the `RowCache`
+    `cache`. `line_mappings` must be the mapping itself, rather than a
+    compiled plan, so that it can be hashed. Rows that fail to map are
+    not cached. If `fields` is given, only those fields are mapped, and
+    rows are cached separately from those mapping other fields.
+    """
+    if isinstance(line_mappings, MappingPlan):
+        raise Exception('Row caching needs the mapping itself, not a compiled plan!')
+
+    plan = compile_mapping(line_mappings, fields=fields)
+    digest = mapping_digest(line_mappings, fields)
+
+    for row, line in enumerate(lines, 1):
+        if line.__class__ is not list and line.__class__ is not tuple:
+            line = list(line)
+
+        key = cache.key(digest, line)
+        attributes = cache.get(key)
+
+        if attributes is None:
+            try:
+                attributes = plan.map_line(line)
+            except Exception as error:
+                if on_error is None:
+                    raise MappingError(row, error) from error
+
+                on_error(MappingError(row, error))
+                continue
+
+            cache.put(key, attributes)
+
+        yield attributes
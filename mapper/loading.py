@@ -0,0 +1,186 @@
+"""
+Loads mapping files, using libyaml where available, and optionally
+caching them on disk once parsed and validated, so that workers
+starting up don't each have to re-parse the YAML.
+
+Primarily defines:
+
+    load_mapping(path_or_stream)
+    load_cached_mapping(path, cache_dir=None)
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import re
+import tempfile
+import time
+
+import yaml
+
+from mapper import validate_line_mappings
+
+logger = logging.getLogger(__name__)
+
+BaseLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+class MappingLoader(BaseLoader):
+    """
+    a safe YAML loader (backed by libyaml, if available) that also
+    understands the Ruby tags that can appear in ndr_import mappings.
+    """
+
+RUBY_REGEXP_FLAGS = {'i': 'i', 'm': 's', 'x': 'x'}
+RUBY_REGEXP_PATTERN = re.compile(r'\A/(.*)/([a-z]*)\Z', re.S)
+
+def construct_ruby_symbol(loader, node):
+    """
+    constructs a Ruby symbol as a ':symbol' string, as used for cleaners.
+    """
+    return ':' + loader.construct_scalar(node)
+
+def construct_ruby_regexp(loader, node):
+    """
+    constructs a serialised Ruby regexp (e.g. /^bob$/i) as a pattern string,
+    translating its flags. Ruby-specific pattern syntax is not translated.
+    """
+    value = loader.construct_scalar(node)
+    match = RUBY_REGEXP_PATTERN.match(value)
+    if not match:
+        return value
+
+    pattern, flags = match.groups()
+    flags = ''.join(RUBY_REGEXP_FLAGS[flag] for flag in flags if flag in RUBY_REGEXP_FLAGS)
+
+    return '(?%s)%s' % (flags, pattern) if flags else pattern
+
+MappingLoader.add_constructor('!ruby/symbol', construct_ruby_symbol)
+MappingLoader.add_constructor('!ruby/sym', construct_ruby_symbol)
+MappingLoader.add_constructor('!ruby/regexp', construct_ruby_regexp)
+
+# Bump to invalidate every cache entry, e.g. if the cached form changes:
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.environ.get('MAPPER_CACHE_DIR') or \
+                    os.path.join(os.path.expanduser('~'), '.cache', 'ndr_import_py')
+
+def parse_mapping(text):
+    """
+    parses the YAML text (or stream) of a mapping.
+    """
+    return yaml.load(text, Loader=MappingLoader)
+
+def load_mapping(source, timings=None):
+    """
+    returns the parsed and validated mapping from `source`, a path or
+    a stream. Times taken to read, parse and validate are logged, and
+    also stored in the `timings` dict (in seconds), if given.
+    """
+    start = time.perf_counter()
+
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, 'rb') as file:
+            content = file.read()
+    else:
+        content = source.read()
+    read = time.perf_counter()
+
+    line_mappings = parse_mapping(content)
+    parsed = time.perf_counter()
+
+    validate_line_mappings(line_mappings)
+    validated = time.perf_counter()
+
+    stages = {'read': read - start, 'parse': parsed - read, 'validate': validated - parsed}
+    logger.debug('loaded mapping %s with %s: %s', getattr(source, 'name', source),
+                 BaseLoader.__name__, ', '.join('%s %.3fs' % stage for stage in stages.items()))
+
+    if timings is not None:
+        timings.update(stages)
+        timings['loader'] = BaseLoader.__name__
+
+    return line_mappings
+
+def cache_key(content):
+    """
+    returns the cache key for a mapping file's content (bytes).
+    """
+    digest = hashlib.sha256(content)
+    digest.update(b'\0%d' % CACHE_VERSION)
+    return digest.hexdigest()
+
+def canonical(value):
+    """
+    returns a repr of a parsed mapping (or part of one) that doesn't
+    depend on the order of dict keys, which may be of mixed types.
+    """
+    if isinstance(value, dict):
+        items = sorted((canonical(key), canonical(item)) for key, item in value.items())
+        return '{%s}' % ', '.join('%s: %s' % item for item in items)
+
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join(canonical(item) for item in value)
+
+    if isinstance(value, (set, frozenset)):
+        return '{%s}' % ', '.join(sorted(canonical(item) for item in value))
+
+    return repr(value)
+
+def mapping_hash(line_mappings):
+    """
+    returns a hash identifying the content of a (parsed) mapping, e.g.
+    to tell whether work done with a mapping can be reused.
+    """
+    return hashlib.sha256(canonical(line_mappings).encode('utf-8')).hexdigest()
+
+def read_cache(cache_path):
+    """
+    returns the mapping cached at `cache_path`, or None if
+    there isn't one (or it can't be read).
+    """
+    try:
+        with open(cache_path, 'rb') as file:
+            return pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        return None
+
+def write_cache(cache_path, line_mappings):
+    """
+    atomically writes `line_mappings` to `cache_path`, ignoring failures
+    (e.g. a read-only cache directory), as the cache is only an optimisation.
+    """
+    directory = os.path.dirname(cache_path)
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                pickle.dump(line_mappings, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, cache_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except OSError:
+        pass
+
+def load_cached_mapping(path, cache_dir=None):
+    """
+    returns the parsed and validated mapping from the YAML file at `path`.
+
+    Mappings are cached in `cache_dir` (by default `DEFAULT_CACHE_DIR`), keyed
+    by a hash of the file's content, so an edited file is simply re-parsed.
+    Cache entries are pickles, so the directory must not be writable by others.
+    """
+    with open(path, 'rb') as file:
+        content = file.read()
+
+    cache_path = os.path.join(cache_dir or DEFAULT_CACHE_DIR, cache_key(content) + '.pickle')
+
+    line_mappings = read_cache(cache_path)
+    if line_mappings is None:
+        line_mappings = parse_mapping(content)
+        validate_line_mappings(line_mappings)
+        write_cache(cache_path, line_mappings)
+
+    return line_mappings
@@ -0,0 +1,87 @@
+"""
+Maps lines across several processes, for CPU-bound feeds.
+
+Primarily defines:
+
+    mapped_lines_parallel(lines, line_mappings, workers=N, chunk_size=K)
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+import os
+
+from mapper import batch_results, compile_mapping, mapped_batch, MappingPlan
+
+# Set in each worker process by `_init_worker`:
+_worker_plan = None
+
+def _init_worker(line_mappings, fields=None):
+    """
+    compiles the mapping once per worker process.
+    """
+    global _worker_plan
+    _worker_plan = compile_mapping(line_mappings, fields=fields)
+
+def _map_chunk(first_row, lines):
+    """
+    maps a chunk of lines in a worker.
+    """
+    return mapped_batch(_worker_plan.map_line, first_row, lines)
+
+def _chunks(lines, chunk_size):
+    """
+    yields (first_row, chunk) pairs from the iterable `lines`.
+    """
+    iterator = iter(lines)
+    first_row = 1
+
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+
+        yield first_row, chunk
+        first_row += len(chunk)
+
+def mapped_lines_parallel(lines, line_mappings, workers=None, chunk_size=1000,
+                          ordered=True, on_error=None, fields=None):
+    """
+    applies mapping to each line of `lines` using a pool of `workers`
+    processes, yielding attributes dicts as `mapped_lines` would.
+
+    Lines are sent to workers in chunks of `chunk_size`, and only a few
+    chunks per worker are in flight at once, so memory stays bounded.
+    Unless `ordered` is True, results are yielded as chunks complete.
+    Errors and `fields` are handled as by `mapped_lines`.
+    """
+    if isinstance(line_mappings, MappingPlan):
+        raise Exception('Parallel mapping needs the mapping itself, not a compiled plan!')
+
+    compile_mapping(line_mappings, fields=fields) # Raise on invalid mappings before forking
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 2
+    chunks = _chunks(lines, chunk_size)
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(line_mappings, fields)) as executor:
+        pending = deque()
+
+        for first_row, chunk in chunks:
+            pending.append(executor.submit(_map_chunk, first_row, chunk))
+            if len(pending) < max_pending:
+                continue
+
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+
+            for future in done:
+                yield from batch_results(future.result(), on_error)
+
+        while pending:
+            yield from batch_results(pending.popleft().result(), on_error)
@@ -0,0 +1,209 @@
+"""
+Optional instrumentation of the mapping engine, to find which
+columns and directives a slow feed is spending its time on.
+
+Primarily defines:
+
+    profiler = MappingProfiler()
+    plan = profiler.instrument(line_mappings)
+
+The instrumented plan can be used wherever a compiled plan is accepted;
+plans that aren't instrumented are unaffected, and pay nothing.
+"""
+
+from functools import partial
+from time import perf_counter_ns
+
+from mapper import apply_field_replaces, ColumnPlan, compile_mapping, isblank, MappingPlan, \
+                   ValidationError
+
+VALUE_DIRECTIVES = ('format', 'clean', 'map', 'match', 'daysafter')
+
+def directive_for(field_mapping):
+    """
+    returns the name of the directive `mapped_value` would apply
+    for `field_mapping`, or 'value' if it just tidies the value.
+    """
+    for directive in VALUE_DIRECTIVES:
+        if directive in field_mapping:
+            return directive
+
+    return 'value'
+
+class TimedCall:
+    """
+    a callable that calls `function`, recording the time taken and
+    its outcome against (column, field, directive) with a profiler.
+    """
+    __slots__ = ('profiler', 'column', 'field', 'directive', 'function')
+
+    def __init__(self, profiler, column, field, directive, function):
+        self.profiler = profiler
+        self.column = column
+        self.field = field
+        self.directive = directive
+        self.function = function
+
+    def __call__(self, *args):
+        start = perf_counter_ns()
+        try:
+            result = self.function(*args)
+        except Exception as error:
+            self.profiler.record(self.column, self.field, self.directive,
+                                 perf_counter_ns() - start, error=error)
+            raise
+
+        self.profiler.record(self.column, self.field, self.directive,
+                             perf_counter_ns() - start, result)
+
+        return result
+
+class InstrumentedConverter:
+    """
+    replaces a field plan's converter (and replaces), timing the replaces
+    and the value mapping of each value in turn.
+    """
+    __slots__ = ('replace', 'convert')
+
+    def __init__(self, profiler, column, field_plan):
+        field = field_plan.field
+
+        self.replace = field_plan.replaces and TimedCall(
+            profiler, column, field, 'replace',
+            partial(apply_field_replaces, replaces=field_plan.replaces)
+        )
+        self.convert = TimedCall(profiler, column, field,
+                                 directive_for(field_plan.field_mapping), field_plan.convert)
+
+    def __call__(self, value):
+        if self.replace:
+            value = self.replace(value)
+
+        return self.convert(value)
+
+def instrumented_column(profiler, column):
+    """
+    returns `column` (a `ColumnPlan`) with its decoders and field
+    mappings timed, unless they already are.
+    """
+    name = column.rawtext_name
+
+    decode = tuple(
+        decoder if isinstance(decoder, TimedCall) else
+        TimedCall(profiler, name, None, 'decode', decoder)
+        for decoder in column.decode
+    )
+    fields = tuple(
+        field_plan if isinstance(field_plan.convert, InstrumentedConverter) else
+        field_plan._replace(replaces=(),
+                            convert=InstrumentedConverter(profiler, name, field_plan))
+        for field_plan in column.fields
+    )
+
+    return column._replace(decode=decode, fields=fields)
+
+class MappingProfiler:
+    """
+    collects call counts, cumulative time, blank results and errors
+    for each (column, field, directive) of instrumented plans, and
+    optionally passes every timing to a `callback` as it happens.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stats = {}
+
+    def instrument(self, line_mappings):
+        """
+        returns an `InstrumentedPlan` for `line_mappings` (or a compiled
+        plan) that reports to this profiler.
+        """
+        plan = compile_mapping(line_mappings)
+
+        return InstrumentedPlan(plan.columns, self, plan.rawtext, plan.column_names)
+
+    def record(self, column, field, directive, elapsed_ns, value=None, error=None):
+        """
+        records a single timed call of a directive.
+        """
+        key = (column, field, directive)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = [0, 0, 0, 0]
+
+        stats[0] += 1
+        stats[1] += elapsed_ns
+        if error is not None:
+            stats[3] += 1
+        elif isblank(value):
+            stats[2] += 1
+
+        if self.callback is not None:
+            self.callback(column, field, directive, elapsed_ns, value, error)
+
+    def report(self):
+        """
+        returns a list of per-directive stats, slowest first.
+        """
+        report = []
+        for (column, field, directive), (calls, time_ns, blanks, errors) in self.stats.items():
+            report.append({
+                'column': column,
+                'field': field,
+                'directive': directive,
+                'calls': calls,
+                'time_ns': time_ns,
+                'ns_per_call': time_ns / calls,
+                'blank_rate': blanks / calls,
+                'errors': errors
+            })
+
+        report.sort(key=lambda stats: stats['time_ns'], reverse=True)
+
+        return report
+
+    def reset(self):
+        """
+        discards all stats collected so far.
+        """
+        self.stats.clear()
+
+class InstrumentedPlan(MappingPlan):
+    """
+    a `MappingPlan` whose decoders, field mappings and validations time
+    each stage of mapping each value, however the plan is used. Note that
+    `map_columns` maps each distinct value of a column once, so those
+    calls are counted once.
+    """
+    __slots__ = ('profiler',)
+
+    def __init__(self, columns, profiler, rawtext=True, column_names=None):
+        super().__init__([
+            instrumented_column(profiler, column) if isinstance(column, ColumnPlan) else column
+            for column in columns
+        ], rawtext, column_names)
+        object.__setattr__(self, 'profiler', profiler)
+
+    def derived(self, columns, column_names=None):
+        return InstrumentedPlan(columns, self.profiler, self.rawtext, column_names)
+
+    def validate(self, col, field_plan, value):
+        start = perf_counter_ns()
+        try:
+            super().validate(col, field_plan, value)
+        except Exception as error:
+            self.profiler.record(self.columns[col].rawtext_name, field_plan.field, 'validates',
+                                 perf_counter_ns() - start, error=error)
+            raise
+
+        self.profiler.record(self.columns[col].rawtext_name, field_plan.field, 'validates',
+                             perf_counter_ns() - start, value)
+
+    def invalid_rule(self, col, field_plan, value):
+        start = perf_counter_ns()
+        rule = super().invalid_rule(col, field_plan, value)
+        error = rule and ValidationError(field_plan.field, rule, '%s failed %s' % (field_plan.field, rule))
+        self.profiler.record(self.columns[col].rawtext_name, field_plan.field, 'validates',
+                             perf_counter_ns() - start, value, error)
+
+        return rule
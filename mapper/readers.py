@@ -0,0 +1,132 @@
+"""
+Reads delimited and fixed-width files, feeding rows to the mapper.
+
+Primarily defines:
+
+    map_file(path, line_mappings, format='csv')
+"""
+
+from contextlib import contextmanager
+import csv
+import os
+
+from mapper import column_name, mapped_lines, MappingPlan
+
+BUFFER_SIZE = 1024 * 1024
+
+DELIMITERS = {
+    'csv': ',',
+    'tsv': '\t',
+    'pipe': '|'
+}
+
+@contextmanager
+def opened(source, encoding='utf-8'):
+    """
+    yields a text stream for `source`, which may be a path or an
+    already open stream (which is left open).
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, encoding=encoding, newline='', buffering=BUFFER_SIZE) as stream:
+            yield stream
+    else:
+        yield source
+
+def delimited_lines(source, delimiter=',', encoding='utf-8'):
+    """
+    yields each row of a delimited file as a list of strings.
+    """
+    with opened(source, encoding) as stream:
+        yield from csv.reader(stream, delimiter=delimiter)
+
+def fixed_width_lines(source, widths, encoding='utf-8'):
+    """
+    yields each line of a fixed-width file, split into
+    a list of strings of the given column `widths`.
+    """
+    slices = []
+    start = 0
+    for width in widths:
+        slices.append(slice(start, start + width))
+        start += width
+
+    with opened(source, encoding) as stream:
+        for line in stream:
+            line = line.rstrip('\r\n')
+            yield [line[column] for column in slices]
+
+def header_indices(header, names):
+    """
+    returns the index of the mapping column named by each column of
+    `header`, given the `names` of the mapping's columns (None for
+    unnamed ones), raising if the header and mapping columns do not
+    correspond.
+    """
+    by_name = {}
+    for index, name in enumerate(names):
+        if name:
+            by_name[name.strip().lower()] = index
+
+    names = [name.strip().lower() for name in header]
+
+    unknown = [name for name in names if name not in by_name]
+    if unknown:
+        raise Exception('Unknown header column(s): %s' % ', '.join(unknown))
+
+    missing = [name for name in by_name if name not in names]
+    if missing:
+        raise Exception('Missing header column(s): %s' % ', '.join(missing))
+
+    return [by_name[name] for name in names]
+
+def mapping_for_header(header, line_mappings):
+    """
+    reorders `line_mappings` (or a compiled plan, keeping its kind) to
+    match the columns named in `header`, raising if the header and
+    mapping columns do not correspond.
+    """
+    if isinstance(line_mappings, MappingPlan):
+        if line_mappings.column_names is None:
+            raise Exception('compiled plan has no column names to match to a header!')
+
+        return line_mappings.reordered(header_indices(header, line_mappings.column_names))
+
+    indices = header_indices(header, [column_name(column_mapping)
+                                      for column_mapping in line_mappings])
+
+    return [line_mappings[index] for index in indices]
+
+def file_lines(source, format='csv', widths=None, encoding='utf-8'):
+    """
+    yields each row of the file `source`, read as the given `format`:
+    one of 'csv', 'tsv', 'pipe' or 'fixed' (which requires `widths`).
+    """
+    if format == 'fixed':
+        if not widths:
+            raise Exception('fixed width files require column widths!')
+
+        return fixed_width_lines(source, widths, encoding)
+
+    if format not in DELIMITERS:
+        raise Exception('file format %s is not implemented!' % format)
+
+    return delimited_lines(source, DELIMITERS[format], encoding)
+
+def map_file(source, line_mappings, format='csv', header=True, widths=None,
+             encoding='utf-8', on_error=None, fields=None):
+    """
+    lazily maps each row of the file `source` (a path or stream), yielding
+    attributes dicts as `mapped_lines` does. If `header` is True, the first
+    row is used to match the file's columns to those of the mapping.
+    If `fields` is given, only those fields are mapped.
+    """
+    lines = file_lines(source, format, widths, encoding)
+
+    if header:
+        first = next(lines, None)
+        if first is None:
+            return
+
+        line_mappings = mapping_for_header(first, line_mappings)
+
+    yield from mapped_lines(lines, line_mappings, on_error, fields=fields)
@@ -0,0 +1,236 @@
+"""
+Scans delimited and fixed-width files through `mmap`, slicing fields as
+memoryviews of the mapped file, and only decoding them to str for the
+columns that the mapping actually uses. Unused columns, and records
+rejected by a `where` filter, never have strings allocated.
+
+Primarily defines:
+
+    scan_file(path, line_mappings, format='csv')
+
+Records end at newlines, so must not contain embedded (e.g. quoted)
+newlines. Quoted fields are otherwise supported, though records that
+contain a quote are parsed by the csv module, as `map_file` would.
+Fixed widths are in bytes.
+"""
+
+import csv
+import mmap
+
+from mapper import _INVALID_COLUMN, ColumnPlan, compile_mapping, mapped_lines
+from mapper.readers import DELIMITERS, mapping_for_header
+
+# How each column's field is passed to the mapping:
+SKIPPED = 0 # as None, as it is never used
+VIEW = 1 # as a memoryview, for the column's decoders
+TEXT = 2 # decoded to str
+INVALID = 3 # as None, but counted, so the mapping reports the wrong number of columns
+
+def column_kinds(plan):
+    """
+    returns how the field of each of the plan's columns should be passed.
+    Columns with decoders are passed their memoryview, as decoders
+    accept bytes-like values.
+    """
+    kinds = []
+    for column in plan.columns:
+        if column is _INVALID_COLUMN:
+            kinds.append(INVALID)
+        elif not isinstance(column, ColumnPlan):
+            kinds.append(SKIPPED)
+        elif column.decode:
+            kinds.append(VIEW)
+        elif column.fields or column.capture_rawtext or plan.rawtext == 'lazy':
+            kinds.append(TEXT)
+        else:
+            kinds.append(SKIPPED)
+
+    return kinds
+
+WHITESPACE = frozenset(b' \t\n\r\x0b\x0c')
+
+def view_field(buffer, view, start, stop, encoding):
+    """
+    returns the field from `start` to `stop` as a memoryview, unless it
+    is blank, which decoders pass over, in which case it is decoded to
+    str, as it would be when read as text.
+    """
+    if start == stop:
+        return ''
+
+    if buffer[start] in WHITESPACE and bytes(view[start:stop]).isspace():
+        return str(view[start:stop], encoding)
+
+    return view[start:stop]
+
+def record_ranges(buffer, start=0):
+    """
+    yields the (start, end) offsets of each record in `buffer`,
+    excluding line endings.
+    """
+    find = buffer.find
+    size = len(buffer)
+
+    while start < size:
+        end = find(b'\n', start)
+        next_start = end + 1
+        if end == -1:
+            end = next_start = size
+
+        if end > start and buffer[end - 1] == 13: # '\r'
+            yield start, end - 1
+        else:
+            yield start, end
+
+        start = next_start
+
+def delimited_line(buffer, view, start, end, delimiter, kinds, column_count, encoding):
+    """
+    returns the fields of the record from `start` to `end`, as the `kinds`
+    of the columns up to the last one used require. Later fields are just
+    counted, to leave a record with too many columns to the mapping to report.
+    A blank record has no fields, as when read by the csv module.
+    """
+    if start == end:
+        return []
+
+    find = buffer.find
+    line = []
+    append = line.append
+
+    for kind in kinds:
+        stop = find(delimiter, start, end)
+        last = stop == -1
+        if last:
+            stop = end
+
+        if kind == TEXT:
+            append(str(view[start:stop], encoding))
+        elif kind == VIEW:
+            append(view_field(buffer, view, start, stop, encoding))
+        else:
+            append(None)
+
+        if last:
+            return line
+
+        start = stop + 1
+
+    for _ in range(column_count - len(kinds)):
+        stop = find(delimiter, start, end)
+        if stop == -1:
+            return line
+
+        start = stop + 1
+
+    return line + [None] * (column_count + 1 - len(line)) # Too many columns
+
+def fixed_width_line(buffer, view, start, end, fields, column_count, encoding):
+    """
+    returns the fields of the record from `start` to `end`, given the
+    (column, relative offset, relative stop, kind) of each used field.
+    """
+    line = [None] * column_count
+
+    for col, offset, stop, kind in fields:
+        field_start = min(start + offset, end)
+        field_stop = min(start + stop, end)
+
+        if kind == TEXT:
+            line[col] = str(view[field_start:field_stop], encoding)
+        else:
+            line[col] = view_field(buffer, view, field_start, field_stop, encoding)
+
+    return line
+
+def scanned_lines(buffer, view, start, kinds, format='csv', widths=None, encoding='utf-8',
+                  where=None):
+    """
+    yields the line of each record in `buffer` from `start`, with
+    fields as `kinds` require, skipping records for which `where`
+    (given the record's memoryview) is false.
+    """
+    if format == 'fixed':
+        fields = []
+        offset = 0
+        for col, (width, kind) in enumerate(zip(widths, kinds)):
+            if kind in (VIEW, TEXT):
+                fields.append((col, offset, offset + width, kind))
+            offset += width
+        column_count = len(widths)
+    else:
+        delimiter = DELIMITERS[format].encode('ascii')
+        column_count = len(kinds)
+        used_kinds = list(kinds)
+        while used_kinds and used_kinds[-1] == SKIPPED:
+            used_kinds.pop()
+
+    for record_start, record_end in record_ranges(buffer, start):
+        if where is not None and not where(view[record_start:record_end]):
+            continue
+
+        if format == 'fixed':
+            yield fixed_width_line(buffer, view, record_start, record_end, fields, column_count,
+                                   encoding)
+        elif buffer.find(b'"', record_start, record_end) == -1:
+            yield delimited_line(buffer, view, record_start, record_end, delimiter, used_kinds,
+                                 column_count, encoding)
+        else:
+            record = str(view[record_start:record_end], encoding)
+            yield next(csv.reader([record], delimiter=DELIMITERS[format]))
+
+def scan_file(path, line_mappings, format='csv', header=True, widths=None, encoding='utf-8',
+              where=None, on_error=None, fields=None):
+    """
+    lazily maps each record of the file at `path`, yielding attributes
+    dicts as `map_file` does, but scanning the file through `mmap`.
+    If given, `where` is passed each record as a memoryview, and records
+    for which it returns false are skipped before any fields are decoded
+    (and aren't counted in the row numbers of errors). If `fields` is
+    given, only those fields are mapped, and only their columns decoded.
+    """
+    if format == 'fixed':
+        if not widths:
+            raise Exception('fixed width files require column widths!')
+    elif format not in DELIMITERS:
+        raise Exception('file format %s is not implemented!' % format)
+
+    with open(path, 'rb') as file:
+        try:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # An empty file can't be mapped
+            return
+
+    try:
+        view = memoryview(buffer)
+        start = 0
+
+        if header:
+            first = next(record_ranges(buffer), None)
+            if first is None:
+                return
+
+            header_line = str(view[first[0]:first[1]], encoding)
+            if format == 'fixed':
+                names = []
+                offset = 0
+                for width in widths:
+                    names.append(header_line[offset:offset + width])
+                    offset += width
+            else:
+                names = next(csv.reader([header_line], delimiter=DELIMITERS[format]))
+
+            line_mappings = mapping_for_header(names, line_mappings)
+            start = buffer.find(b'\n') + 1 or len(buffer)
+
+        plan = compile_mapping(line_mappings, fields=fields)
+        lines = scanned_lines(buffer, view, start, column_kinds(plan), format, widths,
+                              encoding, where)
+
+        yield from mapped_lines(lines, plan, on_error)
+    finally:
+        try:
+            view.release()
+            buffer.close()
+        except BufferError: # Fields are still referenced; closed once they're collected
+            pass
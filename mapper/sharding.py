@@ -0,0 +1,214 @@
+"""
+Maps a large file as independent byte-range shards (e.g. one per node),
+each writing its output and errors to a partition, and then merges the
+partitions in order into one output.
+
+Primarily defines:
+
+    shards = shard_ranges(path, count)
+    map_shard(path, shard, line_mappings, partition_dir) # on each node
+    merge_partitions(partition_dir, len(shards), output, errors_output)
+
+    map_sharded(path, line_mappings, output, shards=N) # all of the above, locally
+
+Shards are split at newlines, so records must not contain embedded
+(e.g. quoted) newlines.
+"""
+
+import base64
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import json
+import os
+import shutil
+import tempfile
+
+from mapper import compile_mapping, MappingPlan
+from mapper.bulk import bulk_mapped_lines, ErrorLog
+from mapper.readers import file_lines, mapping_for_header
+
+Shard = namedtuple('Shard', ['index', 'start', 'end'])
+
+def shard_ranges(path, count, header=True):
+    """
+    splits the file at `path` into `count` shards of about the same
+    size, each starting at the beginning of a record (after any header).
+    Shards may be empty if the file has fewer records than shards.
+    """
+    size = os.path.getsize(path)
+
+    with open(path, 'rb') as file:
+        data_start = len(file.readline()) if header else 0
+        boundaries = [data_start]
+
+        for index in range(1, count):
+            target = data_start + (size - data_start) * index // count
+            if target <= boundaries[-1]:
+                boundaries.append(boundaries[-1])
+                continue
+
+            file.seek(target - 1)
+            file.readline() # To the end of the record that `target` falls in
+            boundaries.append(min(file.tell(), size))
+
+        boundaries.append(size)
+
+    return [Shard(index, boundaries[index], boundaries[index + 1]) for index in range(count)]
+
+def shard_text_lines(path, shard, encoding='utf-8'):
+    """
+    yields each line of text in the byte range of `shard`.
+    """
+    with open(path, 'rb') as file:
+        file.seek(shard.start)
+        remaining = shard.end - shard.start
+
+        while remaining > 0:
+            line = file.readline(remaining)
+            if not line:
+                return
+
+            remaining -= len(line)
+            yield line.decode(encoding)
+
+def serialised(value):
+    """
+    returns a JSON-serialisable form of a mapped value that json can't
+    encode itself: dates as ISO 8601 and bytes as base64.
+    """
+    if isinstance(value, date):
+        return value.isoformat()
+
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(value).decode('ascii')
+
+    raise TypeError('%s is not JSON serialisable' % type(value).__name__)
+
+def partition_paths(partition_dir, index):
+    """
+    returns the output, errors and summary paths of a shard's partition.
+    """
+    stem = os.path.join(partition_dir, 'part-%05d' % index)
+    return stem + '.jsonl', stem + '.errors.jsonl', stem + '.json'
+
+def write_json_lines(path, items):
+    """
+    atomically writes each of `items` to `path` as a line of JSON.
+    """
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            for item in items:
+                file.write(json.dumps(item, default=serialised))
+                file.write('\n')
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def map_shard(path, shard, line_mappings, partition_dir, format='csv', widths=None,
+              encoding='utf-8', budget=None, memoize=False, rawtext=True, fields=None):
+    """
+    maps the records in the byte range of `shard` by the (header-ordered)
+    `line_mappings`, compiled as by `compile_mapping` with `memoize`,
+    `rawtext` and `fields`, writing the attributes and errors (with rows numbered
+    within the shard) as JSON Lines to the shard's partition in
+    `partition_dir`. A summary is written last, marking it complete.
+
+    Returns the summary: the shard index, and its rows and failed rows.
+    """
+    output_path, errors_path, summary_path = partition_paths(partition_dir, shard.index)
+    errors = ErrorLog(budget)
+    plan = compile_mapping(line_mappings, memoize, rawtext, fields)
+
+    lines = file_lines(shard_text_lines(path, shard, encoding), format, widths, encoding)
+    write_json_lines(output_path, bulk_mapped_lines(lines, plan, errors))
+    write_json_lines(errors_path, errors)
+
+    summary = {'shard': shard.index, 'rows': errors.rows, 'failed_rows': errors.failed_rows}
+    write_json_lines(summary_path, [summary])
+
+    return summary
+
+def merge_partitions(partition_dir, count, output, errors_output=None):
+    """
+    concatenates the output of `count` shard partitions, in order, to the
+    file `output`, and their errors to `errors_output` (if given), with
+    rows renumbered across the whole file. Raises if any shard is missing.
+
+    Returns the total rows and failed rows.
+    """
+    totals = {'rows': 0, 'failed_rows': 0}
+
+    with open(output, 'wb') as output_file, \
+         open(errors_output or os.devnull, 'w', encoding='utf-8') as errors_file:
+        for index in range(count):
+            output_path, errors_path, summary_path = partition_paths(partition_dir, index)
+            if not os.path.exists(summary_path):
+                raise Exception('shard %d has not been mapped!' % index)
+
+            with open(summary_path, encoding='utf-8') as file:
+                summary = json.load(file)
+
+            with open(output_path, 'rb') as file:
+                shutil.copyfileobj(file, output_file)
+
+            if errors_output:
+                with open(errors_path, encoding='utf-8') as file:
+                    for line in file:
+                        row, field, rule, value = json.loads(line)
+                        errors_file.write(json.dumps([row + totals['rows'], field, rule, value]))
+                        errors_file.write('\n')
+
+            totals['rows'] += summary['rows']
+            totals['failed_rows'] += summary['failed_rows']
+
+    return totals
+
+def map_sharded(path, line_mappings, output, errors_output=None, shards=None, workers=None,
+                format='csv', header=True, widths=None, encoding='utf-8', budget=None,
+                partition_dir=None, memoize=False, rawtext=True, fields=None):
+    """
+    maps the file at `path` as `shards` shards (by default, one per
+    worker), using a pool of `workers` local processes as stand-ins for
+    nodes, and merges their partitions into `output` and `errors_output`
+    as JSON Lines. `budget` is the error budget of each shard, and each
+    compiles `line_mappings` (which, being sent to the workers, must not be
+    a compiled plan) as `compile_mapping` does with `memoize`, `rawtext`
+    and `fields`.
+
+    Partitions are written to `partition_dir`, or a temporary directory
+    that is removed afterwards. Returns the total rows and failed rows.
+    """
+    if isinstance(line_mappings, MappingPlan):
+        raise Exception('Sharded mapping needs the mapping itself, not a compiled plan!')
+
+    # Raise on invalid mappings (or fields) before forking:
+    compile_mapping(line_mappings, memoize, rawtext, fields)
+
+    if header:
+        lines = file_lines(path, format, widths, encoding)
+        first = next(lines, None)
+        lines.close()
+
+        if first is not None:
+            line_mappings = mapping_for_header(first, line_mappings)
+
+    workers = workers or os.cpu_count() or 1
+    ranges = shard_ranges(path, shards or workers, header)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        partition_dir = partition_dir or temp_dir
+        os.makedirs(partition_dir, exist_ok=True)
+
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(map_shard, path, shard, line_mappings, partition_dir,
+                                format, widths, encoding, budget, memoize, rawtext, fields)
+                for shard in ranges
+            ]
+            for future in futures:
+                future.result()
+
+        return merge_partitions(partition_dir, len(ranges), output, errors_output)
@@ -0,0 +1,300 @@
+"""
+Writes mapped rows out in column batches, as Parquet or Arrow IPC files
+(if pyarrow is installed), or else as CSV or JSON Lines, with a schema
+derived from the mapping.
+
+Primarily defines:
+
+    write_mapped(path, mapped_lines(lines, mapping), mapping, format='parquet')
+
+    with writer_for(path, mapping) as writer:
+        for attributes in mapped_lines(lines, mapping):
+            writer.write(attributes)
+"""
+
+import abc
+import base64
+import csv
+from datetime import datetime
+import json
+import os
+import re
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from mapper import cached_plan, ColumnPlan
+
+BATCH_SIZE = 10000
+
+TIME_DIRECTIVE_PATTERN = re.compile('%[HIMSfpXcT]')
+
+def field_type(field_plans):
+    """
+    returns the type of a field's values: 'date' or 'timestamp' if every
+    mapping to it parses a date (by whether the `format` includes a time),
+    or otherwise 'string'.
+    """
+    formats = [field_plan.field_mapping.get('format') for field_plan in field_plans]
+    if not all(formats) or any(field_plan.join for field_plan in field_plans):
+        return 'string'
+
+    return 'timestamp' if any(TIME_DIRECTIVE_PATTERN.search(fmt) for fmt in formats) else 'date'
+
+def mapping_schema(line_mappings, rawtext=False):
+    """
+    returns the (name, type) of each field mapped by `line_mappings`
+    (or a compiled plan), in the order they are first mapped, followed
+    by a 'rawtext.<name>' string column per captured column if `rawtext`.
+    """
+    plan = cached_plan(line_mappings)
+    columns = [column for column in plan.columns if isinstance(column, ColumnPlan)]
+
+    schema = []
+    for field in plan.layout.fields:
+        field_plans = [field_plan for column in columns for field_plan in column.fields
+                       if field_plan.field == field]
+        schema.append((field, field_type(field_plans)))
+
+    if rawtext:
+        rawtext_names = dict.fromkeys(column.rawtext_name for column in columns)
+        schema.extend(('rawtext.%s' % name, 'string') for name in rawtext_names)
+
+    return schema
+
+def string_value(value):
+    """
+    returns `value` as a str (bytes as base64), or None if it is None.
+    """
+    if value is None or isinstance(value, str):
+        return value
+
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(value).decode('ascii')
+
+    return str(value)
+
+def date_value(value):
+    """
+    returns the date of a parsed `value`, or None.
+    """
+    return value.date() if isinstance(value, datetime) else value
+
+def timestamp_value(value):
+    """
+    returns a parsed `value` as is, as a datetime.
+    """
+    return value
+
+CONVERTERS = {
+    'string': string_value,
+    'date': date_value,
+    'timestamp': timestamp_value
+}
+
+class BatchWriter(abc.ABC):
+    """
+    buffers mapped rows (attributes dicts) and writes them out as column
+    batches of up to `batch_size` rows, so memory use stays bounded.
+    Subclasses implement `write_batch(columns)`, and extend `close()`.
+    """
+
+    def __init__(self, path, schema, batch_size=BATCH_SIZE):
+        self.path = path
+        self.schema = schema
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, attributes):
+        self.rows.append(attributes)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        writes any buffered rows as a batch of columns, converted by type.
+        """
+        if not self.rows:
+            return
+
+        columns = []
+        for name, type in self.schema:
+            convert = CONVERTERS[type]
+            if name.startswith('rawtext.'):
+                rawtext_name = name[len('rawtext.'):]
+                values = [row['rawtext'].get(rawtext_name) if 'rawtext' in row else None
+                          for row in self.rows]
+            else:
+                values = [row.get(name) for row in self.rows]
+
+            columns.append([None if value is None else convert(value) for value in values])
+
+        self.write_batch(columns)
+        self.count += len(self.rows)
+        self.rows = []
+
+    @abc.abstractmethod
+    def write_batch(self, columns):
+        """
+        writes a batch of columns, each a list of values in schema order.
+        """
+
+    def close(self):
+        self.flush()
+
+class CSVWriter(BatchWriter):
+    """
+    writes a CSV file, with a header row of field names.
+    Dates are written in ISO 8601 and missing values as blank.
+    """
+
+    def __init__(self, path, schema, batch_size=BATCH_SIZE):
+        super().__init__(path, schema, batch_size)
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in schema])
+
+    def write_batch(self, columns):
+        for index, (_, type) in enumerate(self.schema):
+            if type != 'string':
+                columns[index] = [value and value.isoformat() for value in columns[index]]
+
+        self.writer.writerows(zip(*columns))
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+class JSONLinesWriter(BatchWriter):
+    """
+    writes a JSON object per row, omitting missing values.
+    Dates are written in ISO 8601.
+    """
+
+    def __init__(self, path, schema, batch_size=BATCH_SIZE):
+        super().__init__(path, schema, batch_size)
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write_batch(self, columns):
+        names = [name for name, _ in self.schema]
+        for index, (_, type) in enumerate(self.schema):
+            if type != 'string':
+                columns[index] = [value and value.isoformat() for value in columns[index]]
+
+        self.file.write(''.join(
+            json.dumps({name: value for name, value in zip(names, values) if value is not None}) + '\n'
+            for values in zip(*columns)
+        ))
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+ARROW_TYPES = {
+    'string': lambda: pyarrow.string(),
+    'date': lambda: pyarrow.date32(),
+    'timestamp': lambda: pyarrow.timestamp('us')
+}
+
+def arrow_schema(schema):
+    """
+    returns the `pyarrow.Schema` for a mapping schema.
+    """
+    return pyarrow.schema([(name, ARROW_TYPES[type]()) for name, type in schema])
+
+class ArrowWriter(BatchWriter):
+    """
+    writes an Arrow IPC (Feather v2) file, a record batch at a time.
+    """
+
+    def __init__(self, path, schema, batch_size=BATCH_SIZE):
+        if pyarrow is None:
+            raise Exception('Arrow output requires pyarrow!')
+
+        super().__init__(path, schema, batch_size)
+        self.arrow_schema = arrow_schema(schema)
+        self.writer = self.open_writer()
+
+    def open_writer(self):
+        return pyarrow.ipc.new_file(self.path, self.arrow_schema)
+
+    def write_batch(self, columns):
+        self.writer.write_batch(pyarrow.record_batch(
+            [pyarrow.array(values, type) for values, type in zip(columns, self.arrow_schema.types)],
+            schema=self.arrow_schema
+        ))
+
+    def close(self):
+        super().close()
+        self.writer.close()
+
+class ParquetWriter(ArrowWriter):
+    """
+    writes a Parquet file, a row group per batch.
+    """
+
+    def __init__(self, path, schema, batch_size=BATCH_SIZE):
+        if pyarrow is None:
+            raise Exception('Parquet output requires pyarrow!')
+
+        super().__init__(path, schema, batch_size)
+
+    def open_writer(self):
+        return pyarrow.parquet.ParquetWriter(self.path, self.arrow_schema)
+
+WRITERS = {
+    'csv': CSVWriter,
+    'jsonl': JSONLinesWriter,
+    'arrow': ArrowWriter,
+    'parquet': ParquetWriter
+}
+
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.parquet': 'parquet'
+}
+
+def default_format():
+    """
+    returns 'parquet' if pyarrow is installed, or else 'csv'.
+    """
+    return 'csv' if pyarrow is None else 'parquet'
+
+def writer_for(path, line_mappings, format=None, rawtext=False, batch_size=BATCH_SIZE):
+    """
+    returns a writer of rows mapped by `line_mappings` to `path`, in the
+    given `format` (one of 'csv', 'jsonl', 'arrow' or 'parquet'), or else
+    by the path's extension, or else `default_format()`.
+    """
+    if format is None:
+        format = EXTENSIONS.get(os.path.splitext(path)[1].lower()) or default_format()
+
+    if format not in WRITERS:
+        raise Exception('output format %s is not implemented!' % format)
+
+    return WRITERS[format](path, mapping_schema(line_mappings, rawtext), batch_size)
+
+def write_mapped(path, rows, line_mappings, format=None, rawtext=False, batch_size=BATCH_SIZE):
+    """
+    writes the attributes dicts `rows` (e.g. from `mapped_lines`) to
+    `path`, as `writer_for` would, returning the number of rows written.
+    """
+    with writer_for(path, line_mappings, format, rawtext, batch_size) as writer:
+        for attributes in rows:
+            writer.write(attributes)
+
+    return writer.count
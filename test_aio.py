@@ -0,0 +1,80 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+from mapper import mapped_line, MappingError
+from mapper.aio import amapped_lines, aqueue_lines
+
+mapping = [
+    {'column': 'name', 'mappings': [{'field': 'name', 'clean': ':name'}]},
+    {'column': 'code', 'mappings': [{'field': 'code', 'validates': {'presence': True}}]}
+]
+
+async def async_lines(lines, pulled=None):
+    for line in lines:
+        if pulled is not None:
+            pulled.append(line)
+        await asyncio.sleep(0)
+        yield line
+
+class TestAio(unittest.IsolatedAsyncioTestCase):
+
+    async def test_should_map_async_lines(self):
+        lines = [['bob', 'A%d' % i] for i in range(25)]
+        results = [attributes async for attributes in amapped_lines(async_lines(lines), mapping, 4)]
+        self.assertEqual([mapped_line(line, mapping) for line in lines], results)
+
+    async def test_should_map_batches_in_executor(self):
+        lines = [['bob', 'A%d' % i] for i in range(25)]
+        with ThreadPoolExecutor(2) as executor:
+            results = [attributes async for attributes in
+                       amapped_lines(async_lines(lines), mapping, 4, executor=executor)]
+
+        self.assertEqual([mapped_line(line, mapping) for line in lines], results)
+
+    async def test_should_only_map_selected_fields(self):
+        lines = [['bob', ''], ['jim', 'B']]
+        results = [attributes async for attributes in
+                   amapped_lines(async_lines(lines), mapping, fields=['name'])]
+
+        self.assertEqual(['BOB', 'JIM'], [attributes['name'] for attributes in results])
+        self.assertNotIn('code', results[1])
+
+    async def test_should_only_pull_lines_as_results_are_consumed(self):
+        pulled = []
+        lines = [['bob', 'A%d' % i] for i in range(100)]
+        results = amapped_lines(async_lines(lines, pulled), mapping, batch_size=10)
+
+        await results.__anext__()
+        self.assertEqual(10, len(pulled))
+        await results.aclose()
+
+    async def test_should_report_errors_with_row_number(self):
+        errors = []
+        lines = [['bob', 'A'], ['jim', ''], ['sue', 'C']]
+        results = [attributes async for attributes in
+                   amapped_lines(async_lines(lines), mapping, 2, on_error=errors.append)]
+
+        self.assertEqual(['BOB', 'SUE'], [attributes['name'] for attributes in results])
+        self.assertEqual(["row 2: code can't be blank"], [str(error) for error in errors])
+
+        with self.assertRaises(MappingError):
+            async for _ in amapped_lines(async_lines(lines), mapping):
+                pass
+
+    async def test_should_map_lines_from_queue(self):
+        queue = asyncio.Queue(maxsize=2)
+
+        async def produce():
+            for i in range(5):
+                await queue.put(['bob', str(i)])
+            await queue.put(None)
+
+        producer = asyncio.ensure_future(produce())
+        results = [attributes async for attributes in amapped_lines(aqueue_lines(queue), mapping)]
+        await producer
+
+        self.assertEqual(['0', '1', '2', '3', '4'], [attributes['code'] for attributes in results])
+
+if __name__ == '__main__':
+    unittest.main()
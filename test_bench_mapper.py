@@ -0,0 +1,35 @@
+import unittest
+
+from bench_mapper import load_timings, regressions, run, synthetic_lines, synthetic_mapping
+from mapper import mapped_line
+
+class TestBenchMapper(unittest.TestCase):
+
+    def test_synthetic_lines_should_suit_synthetic_mapping(self):
+        lines = synthetic_lines(20, 7, 3)
+        self.assertEqual(20, len(lines))
+        self.assertTrue(all(len(line) == 7 for line in lines))
+        self.assertLessEqual(len(set(line[0] for line in lines)), 3)
+
+        line_hash = mapped_line(lines[0], synthetic_mapping(7))
+        self.assertEqual(7, len(line_hash['rawtext']))
+
+    def test_should_run_every_benchmark(self):
+        results = run(rows=5, width=5, cardinality=2, repeat=1)
+        self.assertIn('mapped_line', results)
+        self.assertIn('map_line (generated)', results)
+        self.assertIn('clean :postcode', results)
+        self.assertTrue(all(result['ns_per_op'] > 0 for result in results.values()))
+
+    def test_should_time_loading_mapping(self):
+        timings = load_timings(10, repeat=1)
+        self.assertEqual(['read', 'parse', 'validate'], list(timings))
+        self.assertTrue(all(seconds >= 0 for seconds in timings.values()))
+
+    def test_should_report_regressions_beyond_threshold(self):
+        baseline = {'a': {'ns_per_op': 100}, 'b': {'ns_per_op': 100}}
+        results = {'a': {'ns_per_op': 119}, 'b': {'ns_per_op': 121}, 'c': {'ns_per_op': 500}}
+        self.assertEqual([('b', 100, 121)], regressions(baseline, results, 0.2))
+
+if __name__ == '__main__':
+    unittest.main()
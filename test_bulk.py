@@ -0,0 +1,77 @@
+import unittest
+from unittest import mock
+
+from mapper import mapped_line
+from mapper.bulk import bulk_mapped_lines, ErrorBudgetExceeded, ErrorLog, RowError
+
+mapping = [
+    {'column': 'name', 'mappings': [{'field': 'name', 'clean': ':name'}]},
+    {'column': 'code', 'mappings': [{'field': 'code', 'validates': {'presence': True}}]},
+    {'column': 'date', 'mappings': [{'field': 'date', 'format': '%d/%m/%Y',
+                                     'validates': {'presence': True}}]}
+]
+
+class TestBulk(unittest.TestCase):
+
+    def test_should_map_lines_as_mapped_line(self):
+        lines = [['bob', 'A%d' % i, '01/02/2020'] for i in range(5)]
+        errors = ErrorLog()
+        self.assertEqual([mapped_line(line, mapping) for line in lines],
+                         list(bulk_mapped_lines(lines, mapping, errors)))
+        self.assertEqual({'rows': 5, 'failed_rows': 0, 'errors': {}}, errors.summary())
+
+    def test_should_log_failures_and_continue(self):
+        lines = [['bob', 'A', '01/02/2020'], ['jim', '', 'rubbish'], ['sue', 'C', '01/02/2020'],
+                 ['ann', 'D', '01/02/2020', 'extra']]
+        errors = ErrorLog()
+        with self.assertLogs('mapper.bulk', 'WARNING'):
+            results = list(bulk_mapped_lines(lines, mapping, errors))
+
+        self.assertEqual(['BOB', 'SUE'], [attributes['name'] for attributes in results])
+        self.assertEqual([
+            RowError(2, 'code', 'presence', ''),
+            RowError(2, 'date', 'presence', 'rubbish'),
+            RowError(4, None, 'columns', 4)
+        ], list(errors))
+        self.assertEqual(2, errors.summary()['failed_rows'])
+        self.assertEqual(1, errors.summary()['errors'][('date', 'presence')])
+        self.assertIn('2 of 4 rows failed', errors.report())
+
+    def test_should_check_validations_without_raising(self):
+        lines = [['jim', '', '01/02/2020']]
+        errors = ErrorLog()
+        with mock.patch('mapper.apply_validations_on', side_effect=AssertionError), \
+             self.assertLogs('mapper.bulk', 'WARNING'):
+            self.assertEqual([], list(bulk_mapped_lines(lines, mapping, errors)))
+
+        self.assertEqual([RowError(1, 'code', 'presence', '')], list(errors))
+
+    def test_should_log_lines_reaching_invalid_columns(self):
+        lines = [['bob', 'A', '01/02/2020'], ['jim', 'B', '01/02/2020', 'extra']]
+        errors = ErrorLog()
+        with self.assertLogs('mapper.bulk', 'WARNING'):
+            results = list(bulk_mapped_lines(lines, mapping + [{}], errors))
+
+        self.assertEqual([mapped_line(lines[0], mapping)], results)
+        self.assertEqual([RowError(2, None, 'columns', 4)], list(errors))
+
+    def test_should_log_exceptions_as_errors(self):
+        decoding = [{'column': 'name', 'decode': ['hex'], 'mappings': [{'field': 'name'}]}]
+        lines = [['626f62'], ['zz']]
+        errors = ErrorLog()
+        with self.assertLogs('mapper.bulk', 'WARNING'):
+            self.assertEqual(1, len(list(bulk_mapped_lines(lines, decoding, errors))))
+
+        self.assertEqual([(2, None, 'error')], [entry[:3] for entry in errors])
+
+    def test_should_stop_when_budget_exceeded(self):
+        lines = [['bob', '', '01/02/2020']] * 5
+        errors = ErrorLog(budget=2)
+        with self.assertRaises(ErrorBudgetExceeded):
+            list(bulk_mapped_lines(lines, mapping, errors))
+
+        self.assertEqual(3, errors.rows)
+        self.assertEqual(3, errors.failed_rows)
+
+if __name__ == '__main__':
+    unittest.main()
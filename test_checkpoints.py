@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+import unittest
+
+from mapper import CLEANERS, compile_mapping, register_cleaner
+from mapper.checkpoints import map_file_resumable, read_checkpoint
+from mapper.profiling import MappingProfiler
+
+class Crash(BaseException):
+    pass
+
+mapping = [
+    {'column': 'name', 'mappings': [{'field': 'name', 'clean': ':crashing'}]},
+    {'column': 'code', 'mappings': [{'field': 'code', 'validates': {'presence': True}}]}
+]
+
+class TestCheckpoints(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(CLEANERS.pop, ':crashing', None)
+        self.crash_at = None
+
+        def crashing(value):
+            if value == self.crash_at:
+                raise Crash()
+            return value.upper()
+
+        register_cleaner(':crashing', crashing)
+
+        self.path = os.path.join(directory.name, 'extract.csv')
+        self.output = os.path.join(directory.name, 'mapped.jsonl')
+        self.errors_output = os.path.join(directory.name, 'errors.jsonl')
+        self.checkpoint = os.path.join(directory.name, 'extract.checkpoint')
+
+        with open(self.path, 'w', newline='') as file:
+            file.write('code,name\n')
+            for i in range(100):
+                file.write('%s,smith %d\n' % ('' if i % 9 == 4 else 'C%d' % i, i))
+
+    def map(self, line_mappings=mapping, **options):
+        with self.assertLogs('mapper.bulk', 'WARNING'):
+            return map_file_resumable(self.path, line_mappings, self.output, self.checkpoint,
+                                      self.errors_output, interval=10, durable=False, **options)
+
+    def read(self):
+        with open(self.output) as output, open(self.errors_output) as errors:
+            return output.read(), errors.read()
+
+    def test_should_map_file_and_remove_checkpoint(self):
+        self.assertEqual({'rows': 100, 'failed_rows': 11, 'resumed_from': 0}, self.map())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        output, errors = self.read()
+        self.assertEqual(89, len(output.splitlines()))
+        self.assertEqual({'name': 'SMITH 0', 'code': 'C0', 'rawtext': {'code': 'C0', 'name': 'smith 0'}},
+                         json.loads(output.splitlines()[0]))
+        self.assertEqual([5, 'code', 'presence', ''], json.loads(errors.splitlines()[0]))
+
+    def test_should_resume_from_last_checkpoint(self):
+        self.map()
+        expected = self.read()
+
+        self.crash_at = 'smith 57'
+        with self.assertRaises(Crash):
+            map_file_resumable(self.path, mapping, self.output, self.checkpoint,
+                               self.errors_output, interval=10, durable=False)
+
+        self.assertEqual(51, read_checkpoint(self.checkpoint)['row']) # Row 50 fails validation
+
+        self.crash_at = None
+        self.assertEqual({'rows': 100, 'failed_rows': 11, 'resumed_from': 51}, self.map())
+        self.assertEqual(expected, self.read())
+
+    def test_should_map_with_plan_options(self):
+        profiler = MappingProfiler()
+        self.map(memoize=True, rawtext=False, profiler=profiler)
+
+        output, _ = self.read()
+        self.assertEqual({'name': 'SMITH 0', 'code': 'C0'}, json.loads(output.splitlines()[0]))
+        self.assertEqual(100, {stats['field']: stats for stats in profiler.report()}['name']['calls'])
+
+    def test_should_only_map_selected_fields(self):
+        self.assertEqual({'rows': 100, 'failed_rows': 11, 'resumed_from': 0},
+                         self.map(fields=['code']))
+
+        output, _ = self.read()
+        self.assertEqual({'code': 'C0', 'rawtext': {'code': 'C0'}}, json.loads(output.splitlines()[0]))
+
+    def test_should_refuse_to_resume_with_other_fields(self):
+        self.crash_at = 'smith 57'
+        with self.assertRaises(Crash):
+            map_file_resumable(self.path, mapping, self.output, self.checkpoint, interval=10)
+
+        with self.assertRaises(Exception) as context:
+            map_file_resumable(self.path, mapping, self.output, self.checkpoint, fields=['code'])
+
+        self.assertIn('mapping has changed', str(context.exception))
+
+    def test_should_refuse_compiled_plans(self):
+        with self.assertRaises(Exception) as context:
+            map_file_resumable(self.path, compile_mapping(mapping), self.output, self.checkpoint)
+
+        self.assertIn('not a compiled plan', str(context.exception))
+
+    def test_should_refuse_to_resume_with_changed_mapping(self):
+        self.crash_at = 'smith 57'
+        with self.assertRaises(Crash):
+            map_file_resumable(self.path, mapping, self.output, self.checkpoint, interval=10)
+
+        changed = [mapping[0], {'column': 'code', 'mappings': [{'field': 'code'}]}]
+        with self.assertRaises(Exception) as context:
+            map_file_resumable(self.path, changed, self.output, self.checkpoint)
+
+        self.assertIn('mapping has changed', str(context.exception))
+        self.assertTrue(os.path.exists(self.checkpoint))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import itertools
+import unittest
+from unittest import mock
+
+from mapper import compile_mapping, mapped_line
+from mapper.codegen import generate_source, generated_map_line
+import test_mapper
+
+def generated_mapped_line(line, line_mappings):
+    return generated_map_line(line_mappings)(line)
+
+class TestGeneratedMapper(test_mapper.TestMapper):
+    """
+    runs the whole mapper test suite against generated code.
+    """
+
+    def setUp(self):
+        patcher = mock.patch('test_mapper.mapped_line', generated_mapped_line)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+class TestCodegen(unittest.TestCase):
+
+    def outcome(self, function, line):
+        try:
+            return function(line)
+        except Exception as error:
+            return (type(error), str(error))
+
+    def test_should_match_interpreted_mapping_on_every_fixture(self):
+        values = ['', ' ', 'Bob Fossil', 'Bolo', '25/01/2011', ['Addenbrookes', 'X']]
+        fixtures = [value for value in vars(test_mapper).values()
+                    if isinstance(value, list) and value and isinstance(value[0], dict)]
+
+        for mapping in fixtures:
+            try:
+                plan = compile_mapping(mapping)
+            except Exception:
+                continue
+
+            map_line = generated_map_line(plan)
+            for length in (len(mapping) - 1, len(mapping), len(mapping) + 1):
+                for line in itertools.product(values, repeat=max(length, 0)):
+                    line = list(line)
+                    self.assertEqual(self.outcome(plan.map_line, line), self.outcome(map_line, line))
+
+    def test_should_honour_plan_options(self):
+        mapping = test_mapper.standard_mapping_with
+        line = ['Smith', 'John F', 'male', '01234567']
+
+        for options in [{'memoize': True}, {'rawtext': False}, {'rawtext': ['sex']}, {'rawtext': 'lazy'}]:
+            plan = compile_mapping(mapping, **options)
+            self.assertEqual(plan.map_line(line), generated_map_line(plan)(line))
+
+    def test_should_generate_straight_line_source(self):
+        source, _ = generate_source(compile_mapping(test_mapper.cross_populate_replace_mapping))
+        self.assertNotIn('for ', source)
+        self.assertNotIn('field_mapping', source)
+
+    def test_should_cache_generated_functions(self):
+        mapping = test_mapper.join_mapping
+        self.assertIs(generated_map_line(mapping), generated_map_line(mapping))
+        self.assertEqual(mapped_line(['A', 'B'], mapping), generated_map_line(mapping)(['A', 'B']))
+
+if __name__ == '__main__':
+    unittest.main()
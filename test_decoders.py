@@ -0,0 +1,53 @@
+import base64
+import gzip
+import unittest
+
+from mapper import decode_raw_value, decode_values, mapped_line
+from mapper.decoders import DECODERS, decoder_for, register_decoder
+
+class TestDecoders(unittest.TestCase):
+
+    def test_should_decode_base64_without_copying_to_str(self):
+        encoded = base64.b64encode(b'hello world')
+        self.assertEqual(b'hello world', decode_raw_value(encoded, 'base64'))
+        self.assertEqual(b'hello world', decode_raw_value(memoryview(encoded), 'base64'))
+        self.assertEqual(b'hello world', decode_raw_value(encoded.decode(), ':base64'))
+
+    def test_should_decode_other_encodings(self):
+        self.assertEqual(b'hi', decode_raw_value('6869', 'hex'))
+        self.assertEqual(b'hi', decode_raw_value(base64.b32encode(b'hi'), 'base32'))
+        self.assertEqual(b'caf\xe9', decode_raw_value('caf=E9', 'quoted-printable'))
+
+        encoded = base64.b64encode(gzip.compress(b'a large blob'))
+        self.assertEqual(b'a large blob', decode_raw_value(encoded, 'gzip+base64'))
+
+    def test_should_decode_charsets_to_text(self):
+        self.assertEqual('café', decode_raw_value(b'caf\xe9', 'latin-1'))
+        self.assertEqual('café', decode_raw_value(memoryview('café'.encode()), 'utf-8'))
+
+    def test_should_leave_blank_values_alone(self):
+        self.assertEqual('', decode_raw_value('', 'base64'))
+        self.assertEqual([b'hi', '', None], decode_values(['aGk=', '', None], 'base64'))
+
+    def test_should_decode_columns_in_mappings(self):
+        mapping = [{'column': 'blob', 'decode': [':base64', 'utf-8'], 'mappings': [{'field': 'text'}]}]
+        line_hash = mapped_line([base64.b64encode('café '.encode())], mapping)
+        self.assertEqual('café', line_hash['text'])
+        self.assertEqual('café ', line_hash['rawtext']['blob'])
+
+    def test_should_use_registered_decoder(self):
+        register_decoder('reversed', lambda value: value[::-1])
+        self.addCleanup(DECODERS.pop, 'reversed')
+        self.assertEqual('olleh', decode_raw_value('hello', ':reversed'))
+
+    def test_should_raise_on_unknown_encoding(self):
+        with self.assertRaises(Exception) as cm:
+            decoder_for(':word_doc')
+
+        self.assertEqual('encoding :word_doc is not implemented!', str(cm.exception))
+
+        with self.assertRaises(Exception):
+            decoder_for('zlib_codec')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from mapper import mapped_line, MappingError, standard_mappings
+from mapper.dedup import cached_mapped_lines, RowCache
+
+mapping = [
+    {'column': 'name', 'mappings': [{'field': 'name', 'clean': ':name'}]},
+    {'column': 'date', 'mappings': [{'field': 'date', 'format': '%d/%m/%Y',
+                                     'validates': {'presence': True}}]}
+]
+
+lines = [['smith %d' % i, '%02d/01/2020' % (i % 28 + 1)] for i in range(50)]
+
+class TestDedup(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'rows.sqlite')
+
+    def test_should_serve_rows_mapped_in_earlier_runs(self):
+        expected = [mapped_line(line, mapping) for line in lines]
+
+        with RowCache(self.path, write_batch=7) as cache:
+            self.assertEqual(expected, list(cached_mapped_lines(lines, mapping, cache)))
+            self.assertEqual(0, cache.stats()['hits'])
+
+        with RowCache(self.path) as cache:
+            self.assertEqual(expected, list(cached_mapped_lines(lines, mapping, cache)))
+            self.assertEqual({'hits': 50, 'misses': 0, 'hit_rate': 1.0, 'size': 50, 'evictions': 0},
+                             cache.stats())
+
+    def test_should_not_share_rows_between_mappings(self):
+        changed = [mapping[0], {'column': 'date', 'mappings': [{'field': 'date'}]}]
+
+        with RowCache(self.path) as cache:
+            list(cached_mapped_lines(lines, mapping, cache))
+            results = list(cached_mapped_lines(lines, changed, cache))
+
+        self.assertEqual('01/01/2020', results[0]['date'])
+        self.assertEqual(100, cache.stats()['misses'])
+
+    def test_should_not_share_rows_between_selected_fields(self):
+        with RowCache(self.path) as cache:
+            list(cached_mapped_lines(lines, mapping, cache))
+            results = list(cached_mapped_lines(lines, mapping, cache, fields=['name']))
+            self.assertEqual(results, list(cached_mapped_lines(lines, mapping, cache,
+                                                               fields=['name'])))
+
+        self.assertEqual({'name': 'SMITH 0', 'rawtext': {'name': 'smith 0'}}, results[0])
+        self.assertEqual({'hits': 50, 'misses': 100}, {key: cache.stats()[key]
+                                                       for key in ('hits', 'misses')})
+
+    def test_should_not_share_rows_between_versions(self):
+        with RowCache(self.path) as cache:
+            list(cached_mapped_lines(lines, mapping, cache))
+            with mock.patch('mapper.dedup.ROW_CACHE_VERSION', -1):
+                list(cached_mapped_lines(lines, mapping, cache))
+
+        self.assertEqual(100, cache.stats()['misses'])
+
+    def test_should_not_share_rows_between_changed_standard_mappings(self):
+        standard = [{'standard_mapping': 'surname'}]
+        changed = dict(standard_mappings()['surname'], mappings=[{'field': 'surname'}])
+
+        with RowCache(self.path) as cache:
+            self.assertEqual('SMITH', next(cached_mapped_lines([['smith']], standard, cache))['surname'])
+            with mock.patch.dict(standard_mappings(), surname=changed):
+                result = next(cached_mapped_lines([['smith']], standard, cache))
+
+        self.assertEqual('smith', result['surname'])
+        self.assertEqual(2, cache.stats()['misses'])
+
+    def test_should_evict_least_recently_used_rows(self):
+        with RowCache(self.path, max_rows=20, write_batch=10) as cache:
+            list(cached_mapped_lines(lines, mapping, cache))
+            self.assertEqual(30, cache.stats()['evictions'])
+
+            list(cached_mapped_lines(lines[-20:], mapping, cache))
+            self.assertEqual(20, cache.stats()['hits'])
+            self.assertEqual(20, cache.stats()['size'])
+
+    def test_should_not_cache_rows_that_fail(self):
+        errors = []
+        with RowCache(self.path) as cache:
+            list(cached_mapped_lines([['bob', '']], mapping, cache, on_error=errors.append))
+            with self.assertRaises(MappingError):
+                list(cached_mapped_lines([['bob', '']], mapping, cache))
+
+        self.assertEqual(1, len(errors))
+        self.assertEqual(0, cache.stats()['size'])
+
+if __name__ == '__main__':
+    unittest.main()
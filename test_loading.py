@@ -0,0 +1,107 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from mapper import mapped_line
+from mapper import loading
+from mapper.loading import load_cached_mapping, load_mapping
+
+MAPPING_YAML = """\
+- standard_mapping: forenames
+- column: hospital
+  mappings:
+  - field: hospital
+    replace:
+    - ? 'Addenbrookes'
+      : 'RGT01'
+"""
+
+class TestLoading(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'mapping.yml')
+        self.cache_dir = os.path.join(directory.name, 'cache')
+
+        with open(self.path, 'w') as file:
+            file.write(MAPPING_YAML)
+
+    def test_should_load_and_cache_mapping(self):
+        mapping = load_cached_mapping(self.path, self.cache_dir)
+        self.assertEqual('RGT01 Hospital', mapped_line([' bob ', 'Addenbrookes Hospital'], mapping)['hospital'])
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+        with mock.patch.object(loading, 'parse_mapping') as parse_mapping:
+            self.assertEqual(mapping, load_cached_mapping(self.path, self.cache_dir))
+
+        parse_mapping.assert_not_called()
+
+    def test_should_reparse_changed_file(self):
+        load_cached_mapping(self.path, self.cache_dir)
+
+        with open(self.path, 'a') as file:
+            file.write('- column: extra\n')
+
+        mapping = load_cached_mapping(self.path, self.cache_dir)
+        self.assertEqual('extra', mapping[-1]['column'])
+        self.assertEqual(2, len(os.listdir(self.cache_dir)))
+
+    def test_should_ignore_corrupt_cache_entries(self):
+        expected = load_cached_mapping(self.path, self.cache_dir)
+        for name in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, name), 'wb') as file:
+                file.write(b'rubbish')
+
+        self.assertEqual(expected, load_cached_mapping(self.path, self.cache_dir))
+
+    def test_should_not_cache_invalid_mappings(self):
+        with open(self.path, 'w') as file:
+            file.write('- column: surname\n  standard_mapping: surnames\n')
+
+        with self.assertRaises(Exception):
+            load_cached_mapping(self.path, self.cache_dir)
+
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_should_load_mapping_from_path_or_stream(self):
+        timings = {}
+        mapping = load_mapping(self.path, timings)
+        self.assertEqual({'read', 'parse', 'validate', 'loader'}, set(timings))
+        self.assertEqual({'Addenbrookes': 'RGT01'}, mapping[1]['mappings'][0]['replace'][0])
+
+        with open(self.path, 'rb') as stream:
+            self.assertEqual(mapping, load_mapping(stream))
+
+        self.assertEqual(mapping, load_mapping(io.StringIO(MAPPING_YAML)))
+
+    def test_should_load_ruby_symbols_and_regexps(self):
+        mapping = load_mapping(io.StringIO(
+            "- column: surname\n"
+            "  mappings:\n"
+            "  - field: surname\n"
+            "    clean: !ruby/symbol name\n"
+            "- column: code\n"
+            "  mappings:\n"
+            "  - field: code\n"
+            "    clean: :upcase\n"
+            "    replace:\n"
+            "    - ? !ruby/regexp /^x/i\n"
+            "      : 'Y'\n"
+        ))
+
+        self.assertEqual(':name', mapping[0]['mappings'][0]['clean'])
+        self.assertEqual(':upcase', mapping[1]['mappings'][0]['clean'])
+        self.assertEqual({'(?i)^x': 'Y'}, mapping[1]['mappings'][0]['replace'][0])
+        self.assertEqual({'surname': 'SMITH', 'code': 'Y1'}, {
+            key: value for key, value in mapped_line(['smith', 'x1'], mapping).items() if key != 'rawtext'
+        })
+
+    def test_should_not_construct_arbitrary_objects(self):
+        with self.assertRaises(Exception):
+            load_mapping(io.StringIO('- !!python/object/apply:os.getcwd []\n'))
+
+if __name__ == '__main__':
+    unittest.main()
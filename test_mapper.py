@@ -1,10 +1,13 @@
 import copy
+import itertools
 from datetime import datetime
 import unittest
 import textwrap
 import yaml
 
 from mapper import mapped_line, mapped_value, replace_before_mapping, STANDARD_MAPPINGS
+from mapper import compile_mapping, compiled_pattern, mapped_lines, MappingError, register_cleaner, CLEANERS
+from mapper import parse_date, strptime_or_none, map_columns, MemoizedConverter
 
 def yaml_load(string):
     return yaml.load(textwrap.dedent(string), Loader=yaml.FullLoader)
@@ -15,6 +18,7 @@ clean_name_mapping = { 'clean': ':name' }
 clean_ethniccategory_mapping = { 'clean': ':ethniccategory' }
 clean_icd_mapping = { 'clean': ':icd' }
 clean_opcs_mapping = { 'clean': ':code_opcs' }
+clean_postcode_mapping = { 'clean': ':postcode' }
 clean_code_and_upcase_mapping = { 'clean': [':code', ':upcase'] }
 map_mapping = { 'map': { 'A': '1' } }
 replace_mapping = { 'replace': { '.0': '' } }
@@ -316,6 +320,22 @@ class TestMapper(unittest.TestCase):
     def test_map_should_return_no_date_format(self):
         self.assertIsNone(mapped_value('03/25/2011', format_mapping))
 
+    def test_fast_date_parsing_should_match_strptime(self):
+        values = [
+            '20110125', '2011125', '20111301', '20110230', '20110001', '2011012', '201101250',
+            '25/01/2011', '5/1/2011', ' 5/01/2011', '32/01/2011', '29/02/2012', '29/02/2011',
+            '2011-01-25', '2011-1-25', '2011-01-25 ', '١٢/٠١/٢٠١١', 'rubbish'
+        ]
+        for date_format in ['%Y%m%d', '%d/%m/%Y', '%Y-%m-%d']:
+            for value in values:
+                self.assertEqual(strptime_or_none(value, date_format), parse_date(value, date_format))
+
+    def test_date_parsing_should_be_cached(self):
+        parse_date('01/02/1934', '%d/%m/%Y')
+        hits = parse_date.cache_info().hits
+        self.assertEqual(datetime(1934, 2, 1), parse_date('01/02/1934', '%d/%m/%Y'))
+        self.assertEqual(hits + 1, parse_date.cache_info().hits)
+
     def test_map_should_replace_value(self):
         self.assertEqual('2', replace_before_mapping('2.0', replace_mapping))
 
@@ -331,19 +351,34 @@ class TestMapper(unittest.TestCase):
         self.assertEqual('A', mapped_value('A', clean_ethniccategory_mapping))
         self.assertEqual('INVALID', mapped_value('InVaLiD', clean_ethniccategory_mapping))
 
-    @unittest.skip('icd cleaning not implemented yet')
     def test_map_should_clean_icd_code(self):
         self.assertEqual('C343 R932 Z515', mapped_value('C34.3,R93.2,Z51.5', clean_icd_mapping))
 
-    @unittest.skip('opcs cleaning not implemented yet')
     def test_map_should_clean_opcs_code(self):
         self.assertEqual('U212 Y973', mapped_value('U212,Y973,X1', clean_opcs_mapping))
         self.assertEqual('', mapped_value('98', clean_opcs_mapping))
         self.assertEqual('', mapped_value('TooLong', clean_opcs_mapping))
-        self.assertIsNone('', mapped_value('', clean_opcs_mapping))
+        self.assertEqual('', mapped_value('', clean_opcs_mapping))
         self.assertEqual('ABCD', mapped_value('AbcD', clean_opcs_mapping))
         self.assertEqual('1234', mapped_value('1234', clean_opcs_mapping))
 
+    def test_map_should_clean_postcode(self):
+        self.assertEqual('CB3 0DS', mapped_value('cb30ds', clean_postcode_mapping))
+        self.assertEqual('B1  1AA', mapped_value(' b1 1aa', clean_postcode_mapping))
+        self.assertEqual('SW1A1AA', mapped_value('SW1A 1AA', clean_postcode_mapping))
+        self.assertEqual('NOT A POSTCODE', mapped_value('NOT A POSTCODE', clean_postcode_mapping))
+
+    def test_map_should_use_registered_cleaner(self):
+        register_cleaner(':reverse', lambda string: string[::-1])
+        self.addCleanup(CLEANERS.pop, ':reverse')
+        self.assertEqual('CBA', mapped_value('abc', {'clean': [':reverse', ':upcase']}))
+
+    def test_should_raise_on_unknown_cleaner(self):
+        with self.assertRaises(Exception) as cm:
+            compile_mapping([{'column': 'a', 'mappings': [{'field': 'a', 'clean': ':unknown'}]}])
+
+        self.assertEqual('unknown cleaner: :unknown!', str(cm.exception))
+
     def test_map_should_use_multiple_cleans(self):
         self.assertEqual('U3 Y2 X1', mapped_value('u3,y2,x1', clean_code_and_upcase_mapping))
 
@@ -380,7 +415,7 @@ class TestMapper(unittest.TestCase):
         self.assertEqual('1 test road, testtown', line_hash['address'])
         self.assertEqual('1 test road, testtown', line_hash['rawtext']['patient address'])
 
-    @unittest.skip('opcs cleaning not implemented yet')
+    @unittest.skip('blank mapped values are omitted, rather than mapped to None')
     def test_line_mapping_should_create_valid_hash_with_blank_cleaned_value(self):
         self.assertEqual('', mapped_value('98', clean_opcs_mapping))
         line_hash = mapped_line(['98'], simple_mapping_with_clean_opcs)
@@ -576,5 +611,232 @@ class TestMapper(unittest.TestCase):
         with self.assertRaises(Exception):
             mapped_line(['A'], invalid_decode_mapping)
 
+    def test_compiled_mapping_should_match_mapped_line(self):
+        plan = compile_mapping(cross_populate_replace_mapping)
+        for line in [['Bob Fossil', ''], ['Bob Fossil', 'C1234'], ['Bob Smith', '']]:
+            self.assertEqual(mapped_line(line, cross_populate_replace_mapping), plan.map_line(line))
+
+        plan = compile_mapping(standard_mapping_with)
+        line = ['Smith', 'John F', 'male', '01234567']
+        self.assertEqual(mapped_line(line, standard_mapping_without), plan.map_line(line))
+
+    def test_compiled_mapping_should_be_immutable(self):
+        plan = compile_mapping(simple_mapping)
+        with self.assertRaises(AttributeError):
+            plan.columns = ()
+
+    def test_mapped_lines_should_map_lazily(self):
+        lines = iter([['Bob Fossil', ''], ['Bob Smith', 'C1234']])
+        results = mapped_lines(lines, cross_populate_replace_mapping)
+
+        self.assertEqual(mapped_line(['Bob Fossil', ''], cross_populate_replace_mapping), next(results))
+        self.assertEqual(['Bob Smith', 'C1234'], next(lines))
+        self.assertEqual([], list(results))
+
+    def test_mapped_lines_should_raise_with_row_number(self):
+        with self.assertRaises(MappingError) as cm:
+            list(mapped_lines([['A', 'B'], ['', 'C']], validates_presence_mapping))
+
+        self.assertEqual(2, cm.exception.row)
+        self.assertEqual("row 2: field_one can't be blank", str(cm.exception))
+
+    def test_mapped_lines_should_report_errors_and_continue(self):
+        errors = []
+        lines = [['', 'A'], ['B', 'C'], ['', 'D']]
+        results = list(mapped_lines(lines, validates_presence_mapping, on_error=errors.append))
+
+        self.assertEqual(['B'], [result['field_one'] for result in results])
+        self.assertEqual([1, 3], [error.row for error in errors])
+
+    def test_compiled_mapping_should_precompile_patterns(self):
+        plan = compile_mapping(cross_populate_replace_mapping)
+        misses = compiled_pattern.cache_info().misses
+
+        line_hash = plan.map_line(['Bob Fossil', ''])
+        self.assertEqual('ROBERT FOSSIL', line_hash['consultantcode'])
+        self.assertEqual(misses, compiled_pattern.cache_info().misses)
+
+    def test_map_columns_should_match_mapped_line(self):
+        cases = [
+            (cross_populate_replace_mapping, [['Bob Fossil', ''], ['Bob Smith', 'C1'], ['', '']]),
+            (cross_populate_map_reverse_priority_mapping, [['Bob Fossil', 'P2'], ['Bolo', 'P2']]),
+            (joined_mapping_blank_start_uncompacted, [['', 'CB3 0DS'], ['1 Road', ''], ['', '']]),
+            (standard_mapping_with, [['Smith', 'John F', 'male', '01234567'], ['', '', '', '']])
+        ]
+
+        for mapping, lines in cases:
+            expected = [mapped_line(line, mapping) for line in lines]
+            fields = map_columns(zip(*lines), mapping)
+
+            for row, line_hash in enumerate(expected):
+                for field, value in line_hash.items():
+                    if field == 'rawtext':
+                        for name, raw_value in value.items():
+                            self.assertEqual(raw_value, fields['rawtext'][name][row])
+                    else:
+                        self.assertEqual(value, fields[field][row])
+
+                for field in set(fields) - set(line_hash):
+                    self.assertIsNone(fields[field][row])
+
+    def test_map_columns_should_raise_with_row_number(self):
+        with self.assertRaises(MappingError) as cm:
+            map_columns([['A', ''], ['B', 'C']], validates_presence_mapping)
+
+        self.assertEqual("row 2: field_one can't be blank", str(cm.exception))
+
+    def test_map_columns_should_raise_for_first_failing_row_of_any_field(self):
+        mapping = yaml_load("""\
+        - column: a
+          mappings:
+          - field: a
+            validates:
+              presence: true
+        - column: b
+          mappings:
+          - field: b
+            validates:
+              presence: true
+        """)
+        lines = [['x', 'y'], ['x', ''], ['', 'y']]
+
+        with self.assertRaises(MappingError) as cm:
+            list(mapped_lines(lines, mapping))
+        self.assertEqual("row 2: b can't be blank", str(cm.exception))
+
+        with self.assertRaises(MappingError) as cm:
+            map_columns(zip(*lines), mapping)
+        self.assertEqual("row 2: b can't be blank", str(cm.exception))
+
+    def test_map_record_should_match_map_line(self):
+        mappings = [
+            simple_mapping, unused_mapping, join_mapping, join_compact_mapping,
+            cross_populate_mapping, cross_populate_replace_mapping, cross_populate_map_mapping,
+            cross_populate_map_reverse_priority_mapping, cross_populate_order_mapping,
+            cross_populate_no_priority, standard_mapping_with, standard_mapping_merge,
+            joined_mapping_blank_start, joined_mapping_blank_start_uncompacted
+        ]
+        values = ['', 'Bob Fossil', 'Bolo', 'C1234', 'Smith']
+
+        for mapping in mappings:
+            plan = compile_mapping(mapping)
+            for line in itertools.product(values, repeat=len(mapping)):
+                line = list(line)
+                self.assertEqual(plan.map_line(line), plan.map_record(line).to_dict())
+
+    def test_map_record_should_support_field_access(self):
+        record = compile_mapping(cross_populate_map_mapping).map_record(['Bob Fossil', ''])
+        self.assertEqual('C5678', record['consultantcode'])
+        self.assertEqual('', record['rawtext']['referringcliniciancode'])
+        self.assertIn('consultantname', record)
+        self.assertNotIn('unknown', record)
+        self.assertIsNone(record.get('unknown'))
+
+        results = mapped_lines([['Bob Fossil', '']], cross_populate_map_mapping, records=True)
+        self.assertEqual(record.to_dict(), next(results).to_dict())
+
+    def test_memoized_mapping_should_match_mapped_line(self):
+        plan = compile_mapping(cross_populate_replace_mapping, memoize=True)
+        lines = [['Bob Fossil', ''], ['Bob Fossil', 'C1234'], ['Bob Smith', ''], ['Bob Fossil', '']]
+        for line in lines:
+            self.assertEqual(mapped_line(line, cross_populate_replace_mapping), plan.map_line(line))
+
+        stats = {stat['field']: stat for stat in plan.memo_stats()}
+        self.assertEqual(3, len(plan.memo_stats()))
+        self.assertEqual({'hits': 2, 'misses': 2, 'size': 2, 'enabled': True}, {
+            key: stats['consultantname'][key] for key in ('hits', 'misses', 'size', 'enabled')
+        })
+
+    def test_memoized_converter_should_evict_least_recently_used(self):
+        converter = MemoizedConverter(str.upper, maxsize=2)
+        for value in ['a', 'b', 'a', 'c', 'a']:
+            self.assertEqual(value.upper(), converter(value))
+
+        self.assertEqual(['c', 'a'], list(converter.cache))
+        self.assertEqual({'hits': 2, 'misses': 3, 'size': 2, 'enabled': True}, converter.stats())
+
+    def test_memoized_converter_should_disable_itself_on_low_hit_rate(self):
+        converter = MemoizedConverter(str.upper, window=10, min_hit_rate=0.5)
+        for value in range(10):
+            converter(str(value))
+
+        self.assertFalse(converter.enabled)
+        self.assertEqual('X', converter('x'))
+        self.assertEqual(0, converter.stats()['size'])
+
+    def test_should_not_capture_rawtext_when_off(self):
+        plan = compile_mapping(cross_populate_mapping, rawtext=False)
+        line_hash = plan.map_line(['Bob Fossil', 'C1234'])
+        self.assertEqual({'consultantname': 'Bob Fossil', 'consultantcode': 'C1234'}, line_hash)
+        self.assertNotIn('rawtext', plan.map_record(['Bob Fossil', 'C1234']).to_dict())
+
+    def test_should_only_capture_selected_rawtext_columns(self):
+        plan = compile_mapping(cross_populate_mapping, rawtext=['ReferringClinicianCode'])
+        expected = {'referringcliniciancode': 'C1234'}
+        self.assertEqual(expected, plan.map_line(['Bob Fossil', 'C1234'])['rawtext'])
+        self.assertEqual(expected, plan.map_record(['Bob Fossil', 'C1234'])['rawtext'])
+        self.assertEqual({'referringcliniciancode': ['C1234']},
+                         plan.map_columns([['Bob Fossil'], ['C1234']])['rawtext'])
+
+    def test_should_capture_rawtext_lazily(self):
+        plan = compile_mapping(standard_mapping_with, rawtext='lazy')
+        line = ['Smith', 'John F', 'male', '01234567']
+        line_hash = plan.map_line(line)
+        self.assertIsNone(line_hash['rawtext'].rawtext)
+
+        expected = mapped_line(line, standard_mapping_with)
+        self.assertEqual(expected['rawtext'], line_hash['rawtext'])
+        self.assertEqual('John F', line_hash['rawtext']['forenames'])
+        self.assertEqual(expected, plan.map_record(line).to_dict())
+
+    def test_should_only_map_selected_fields(self):
+        line = ['Bob Fossil', 'C1234', 'x', 'y']
+        plan = compile_mapping(cross_populate_order_mapping, fields=['consultantcode'])
+        expected = mapped_line(line, cross_populate_order_mapping)
+        del expected['consultantname']
+        self.assertEqual(expected, plan.map_line(line))
+
+        line = ['Bob Fossil', '']
+        plan = compile_mapping(cross_populate_mapping, fields=['consultantname'])
+        self.assertEqual({'consultantname': 'Bob Fossil', 'rawtext': {'referringclinicianname': 'Bob Fossil'}},
+                         plan.map_line(line))
+        self.assertEqual(['consultantname'], [field_plan.field for field_plan in plan.columns[0].fields])
+        self.assertIsNone(plan.columns[1])
+
+    def test_should_skip_validations_of_fields_not_selected(self):
+        lines = [['', 'kept'], ['bad', '']]
+        mapping = [validates_presence_mapping[0],
+                   {'column': 'other', 'mappings': [{'field': 'other', 'validates': {'presence': True}}]}]
+        errors = []
+        results = list(mapped_lines(lines, mapping, on_error=errors.append, fields=['other']))
+
+        self.assertEqual([{'other': 'kept', 'rawtext': {'other': 'kept'}}], results)
+        self.assertEqual(['row 2: other can\'t be blank'], [str(error) for error in errors])
+
+    def test_should_prune_compiled_plans_and_refuse_unknown_fields(self):
+        plan = compile_mapping(cross_populate_mapping, rawtext=['ReferringClinicianCode'])
+        pruned = compile_mapping(plan, fields=['consultantname'])
+        self.assertEqual({'consultantname': 'Bob Fossil', 'rawtext': {'referringcliniciancode': 'C1234'}},
+                         pruned.map_line(['Bob Fossil', 'C1234']))
+
+        with self.assertRaises(Exception) as cm:
+            plan.pruned(['consultantname', 'nonsense'])
+
+        self.assertEqual('Unknown field(s): nonsense', str(cm.exception))
+
+    def test_map_columns_should_only_map_selected_fields(self):
+        lines = [['Bob Fossil', 'C1234'], ['Jim Fossil', '']]
+        fields = map_columns(zip(*lines), cross_populate_mapping, fields=['consultantname'])
+
+        self.assertEqual({'consultantname': ['Bob Fossil', 'Jim Fossil'],
+                          'rawtext': {'referringclinicianname': ['Bob Fossil', 'Jim Fossil']}},
+                         fields)
+
+    def test_compiled_mapping_should_validate_once_up_front(self):
+        with self.assertRaises(Exception) as cm:
+            compile_mapping(invalid_priorities)
+
+        self.assertEqual("Field 'columntwo' cannot have duplicate priorities!", str(cm.exception))
+
 if __name__ == '__main__':
     unittest.main()
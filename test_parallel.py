@@ -0,0 +1,69 @@
+import textwrap
+import unittest
+import yaml
+
+from mapper import compile_mapping, mapped_lines
+from mapper.parallel import mapped_lines_parallel
+
+def yaml_load(string):
+    return yaml.load(textwrap.dedent(string), Loader=yaml.FullLoader)
+
+cross_populate_replace_mapping = yaml_load("""\
+- column: referringclinicianname
+  mappings:
+  - field: consultantname
+  - field: consultantcode
+    priority: 2
+    replace:
+      ? (?i)^BOB FOSSIL$
+      : "ROBERT FOSSIL"
+- column: referringcliniciancode
+  mappings:
+  - field: consultantcode
+    priority: 1
+""")
+
+validates_presence_mapping = yaml_load("""\
+- column: column_one
+  mappings:
+  - field: field_one
+    validates:
+      presence: true
+- column: column_two
+  mappings:
+  - field: field_two
+""")
+
+class TestParallel(unittest.TestCase):
+
+    def test_mapped_lines_parallel_should_match_serial(self):
+        lines = [['Bob Fossil', str(i)] for i in range(50)] + [['Bob Fossil', '']]
+        expected = list(mapped_lines(lines, cross_populate_replace_mapping))
+
+        results = mapped_lines_parallel(lines, cross_populate_replace_mapping, workers=2, chunk_size=7)
+        self.assertEqual(expected, list(results))
+
+        results = mapped_lines_parallel(
+            lines, cross_populate_replace_mapping, workers=2, chunk_size=7, ordered=False
+        )
+        key = lambda attributes: attributes['rawtext']['referringcliniciancode']
+        self.assertEqual(sorted(expected, key=key), sorted(results, key=key))
+
+    def test_mapped_lines_parallel_should_report_errors_with_row_number(self):
+        errors = []
+        lines = [['A', 'B'], ['', 'C'], ['D', 'E']]
+        results = mapped_lines_parallel(
+            lines, validates_presence_mapping, workers=2, chunk_size=2, on_error=errors.append
+        )
+
+        self.assertEqual(['A', 'D'], [result['field_one'] for result in results])
+        self.assertEqual(["row 2: field_one can't be blank"], [str(error) for error in errors])
+
+    def test_mapped_lines_parallel_should_refuse_compiled_plans(self):
+        with self.assertRaises(Exception) as context:
+            list(mapped_lines_parallel([['A', 'B']], compile_mapping(validates_presence_mapping)))
+
+        self.assertIn('not a compiled plan', str(context.exception))
+
+if __name__ == '__main__':
+    unittest.main()
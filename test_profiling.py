@@ -0,0 +1,108 @@
+import textwrap
+import unittest
+import yaml
+from unittest import mock
+
+import mapper
+from mapper import map_columns, mapped_line, mapped_lines
+from mapper.profiling import MappingProfiler
+
+def yaml_load(string):
+    return yaml.load(textwrap.dedent(string), Loader=yaml.FullLoader)
+
+mapping = yaml_load("""\
+- column: name
+  mappings:
+  - field: name
+    clean: :name
+  - field: code
+    replace:
+      ? (?i)^BOB$
+      : "B1"
+    validates:
+      presence: true
+- column: dob
+  mappings:
+  - field: dob
+    format: '%d/%m/%Y'
+""")
+
+class TestProfiling(unittest.TestCase):
+
+    def test_instrumented_plan_should_map_as_normal(self):
+        plan = MappingProfiler().instrument(mapping)
+        for line in [['bob', '01/02/2003'], ['alice', 'invalid']]:
+            self.assertEqual(mapped_line(line, mapping), plan.map_line(line))
+
+    def test_should_instrument_mappings_with_invalid_columns(self):
+        plan = MappingProfiler().instrument(mapping + [{}])
+        self.assertEqual(mapped_line(['bob', '01/02/2003'], mapping), plan.map_line(['bob', '01/02/2003']))
+
+    def test_should_instrument_records_and_columns(self):
+        profiler = MappingProfiler()
+        plan = profiler.instrument(mapping)
+        lines = [['bob', '01/02/2003'], ['alice', '01/02/2003']]
+
+        records = list(mapped_lines(lines, plan, records=True))
+        self.assertEqual(list(mapped_lines(lines, mapping)), [record.to_dict() for record in records])
+        self.assertEqual(2, {stats['field']: stats for stats in profiler.report()}['dob']['calls'])
+
+        profiler.reset()
+        self.assertEqual(map_columns(zip(*lines), mapping), plan.map_columns(zip(*lines)))
+        self.assertEqual(1, {stats['field']: stats for stats in profiler.report()}['dob']['calls'])
+
+    def test_should_keep_instrumenting_pruned_plans(self):
+        profiler = MappingProfiler()
+        results = list(mapped_lines([['bob', '01/02/2003']], profiler.instrument(mapping),
+                                    fields=['dob']))
+
+        self.assertEqual([{'dob': mapped_line(['bob', '01/02/2003'], mapping)['dob'],
+                           'rawtext': {'dob': '01/02/2003'}}], results)
+        self.assertEqual([('dob', 'format')],
+                         [(stats['field'], stats['directive']) for stats in profiler.report()])
+
+    def test_should_report_per_directive_stats(self):
+        profiler = MappingProfiler()
+        lines = [['bob', '01/02/2003'], ['alice', 'invalid'], ['', '']]
+        results = list(mapped_lines(lines, profiler.instrument(mapping), on_error=lambda e: None))
+        self.assertEqual(2, len(results))
+
+        report = {(stats['field'], stats['directive']): stats for stats in profiler.report()}
+        self.assertEqual(
+            {('name', 'clean'), ('code', 'replace'), ('code', 'value'), ('code', 'validates'),
+             ('dob', 'format')},
+            set(report)
+        )
+        self.assertEqual(3, report[('name', 'clean')]['calls'])
+        self.assertEqual(2, report[('dob', 'format')]['calls'])
+        self.assertEqual(0.5, report[('dob', 'format')]['blank_rate'])
+        self.assertEqual(1, report[('code', 'validates')]['errors'])
+        self.assertTrue(all(stats['time_ns'] >= 0 for stats in report.values()))
+
+    def test_should_validate_each_value_once(self):
+        plan = MappingProfiler().instrument(mapping)
+        with mock.patch('mapper.presence_validation_on',
+                        wraps=mapper.presence_validation_on) as validation:
+            plan.map_line(['bob', '01/02/2003'])
+
+        self.assertEqual(1, validation.call_count)
+
+    def test_should_record_failed_rules_of_bulk_mapping(self):
+        profiler = MappingProfiler()
+        plan = profiler.instrument(mapping)
+        plan.map_values(['', ''], on_invalid=lambda col, field, rule: None)
+
+        stats = {(stats['field'], stats['directive']): stats for stats in profiler.report()}
+        self.assertEqual(1, stats[('code', 'validates')]['errors'])
+
+    def test_should_pass_timings_to_callback(self):
+        events = []
+        plan = MappingProfiler(callback=lambda *event: events.append(event)).instrument(mapping)
+        plan.map_line(['bob', '01/02/2003'])
+
+        self.assertEqual(('name', 'name', 'clean'), events[0][:3])
+        self.assertEqual('BOB', events[0][4])
+        self.assertEqual(5, len(events))
+
+if __name__ == '__main__':
+    unittest.main()
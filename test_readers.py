@@ -0,0 +1,96 @@
+import io
+import os
+import tempfile
+import textwrap
+import unittest
+import yaml
+
+from mapper import compile_mapping
+from mapper.profiling import InstrumentedPlan, MappingProfiler
+from mapper.readers import delimited_lines, fixed_width_lines, map_file, mapping_for_header
+
+def yaml_load(string):
+    return yaml.load(textwrap.dedent(string), Loader=yaml.FullLoader)
+
+mapping = yaml_load("""\
+- column: hospital
+  mappings:
+  - field: hospital
+    replace:
+      ? Addenbrookes
+      : 'RGT01'
+- standard_mapping: surname
+- column: ignore_me
+  do_not_capture: true
+""")
+
+class TestReaders(unittest.TestCase):
+
+    def test_should_read_delimited_lines(self):
+        stream = io.StringIO('a|"b|c"|d\n1|2|3\n')
+        self.assertEqual([['a', 'b|c', 'd'], ['1', '2', '3']], list(delimited_lines(stream, '|')))
+
+    def test_should_read_fixed_width_lines(self):
+        stream = io.StringIO('AB123  x\r\nCD45   y\n')
+        lines = list(fixed_width_lines(stream, [2, 5, 1]))
+        self.assertEqual([['AB', '123  ', 'x'], ['CD', '45   ', 'y']], lines)
+
+    def test_should_reorder_mapping_to_match_header(self):
+        reordered = mapping_for_header(['Surname', 'IGNORE_ME', 'hospital'], mapping)
+        self.assertEqual([mapping[1], mapping[2], mapping[0]], reordered)
+
+    def test_should_reorder_compiled_plan_to_match_header(self):
+        plan = MappingProfiler().instrument(mapping)
+        reordered = mapping_for_header(['Surname', 'IGNORE_ME', 'hospital'], plan)
+
+        self.assertIsInstance(reordered, InstrumentedPlan)
+        self.assertEqual([plan.columns[1], plan.columns[2], plan.columns[0]], list(reordered.columns))
+        self.assertEqual(('surname', 'ignore_me', 'hospital'), reordered.column_names)
+
+    def test_should_raise_on_unknown_header_column(self):
+        with self.assertRaises(Exception) as cm:
+            mapping_for_header(['surname', 'hospital', 'ignore_me', 'extra'], mapping)
+
+        self.assertEqual('Unknown header column(s): extra', str(cm.exception))
+
+    def test_should_raise_on_missing_header_column(self):
+        with self.assertRaises(Exception) as cm:
+            mapping_for_header(['surname', 'hospital'], mapping)
+
+        self.assertEqual('Missing header column(s): ignore_me', str(cm.exception))
+
+    def test_should_map_file_from_path(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'extract.tsv')
+            with open(path, 'w') as file:
+                file.write('surname\tignore_me\thospital\n')
+                file.write('smith\trubbish\tAddenbrookes Hospital\n')
+
+            results = list(map_file(path, mapping, format='tsv'))
+
+        self.assertEqual(1, len(results))
+        self.assertEqual('SMITH', results[0]['surname'])
+        self.assertEqual('RGT01 Hospital', results[0]['hospital'])
+        self.assertNotIn('ignore_me', results[0]['rawtext'])
+
+    def test_should_map_file_with_compiled_plans(self):
+        content = 'surname,ignore_me,hospital\nsmith,rubbish,Addenbrookes Hospital\n'
+        expected = list(map_file(io.StringIO(content), mapping))
+
+        profiler = MappingProfiler()
+        for plan in (profiler.instrument(mapping), compile_mapping(mapping, memoize=True),
+                     compile_mapping(mapping, rawtext='lazy')):
+            self.assertEqual(expected, list(map_file(io.StringIO(content), plan)))
+
+        self.assertIn(('hospital', 'hospital', 'replace'),
+                      {(stats['column'], stats['field'], stats['directive'])
+                       for stats in profiler.report()})
+
+    def test_should_map_fixed_width_file_without_header(self):
+        stream = io.StringIO('Addenbrookes Smith  xx\n')
+        results = list(map_file(stream, mapping, format='fixed', header=False, widths=[13, 7, 2]))
+        self.assertEqual('RGT01', results[0]['hospital'])
+        self.assertEqual('SMITH', results[0]['surname'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import base64
+import os
+import tempfile
+import unittest
+
+from mapper.readers import map_file
+from mapper.scanning import column_kinds, scan_file, SKIPPED, TEXT, VIEW
+from mapper import compile_mapping
+from mapper.profiling import MappingProfiler
+
+mapping = [
+    {'column': 'name', 'mappings': [{'field': 'name', 'clean': ':name'}]},
+    {'column': 'notes', 'do_not_capture': True},
+    {'column': 'photo', 'decode': ['base64'], 'mappings': [{'field': 'photo'}]},
+    {'column': 'date', 'mappings': [{'field': 'date', 'format': '%d/%m/%Y'}]}
+]
+
+class TestScanning(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'extract')
+
+    def write(self, content):
+        with open(self.path, 'wb') as file:
+            file.write(content)
+
+    def test_should_only_pass_text_for_used_columns(self):
+        self.assertEqual([TEXT, SKIPPED, VIEW, TEXT], column_kinds(compile_mapping(mapping)))
+        self.assertEqual([TEXT, SKIPPED, VIEW, SKIPPED],
+                         column_kinds(compile_mapping(mapping[:3] + [{'column': 'date'}], rawtext=False)))
+
+    def test_should_scan_as_map_file_does(self):
+        photo = base64.b64encode(b'\x89PNG').decode()
+        self.write(('name,notes,photo,date\r\n'
+                    'smith,n1,%s,01/02/2020\r\n'
+                    '"jones, jnr",n2,,\r\n'
+                    '\r\n'
+                    'patel,n3,%s,03/04/2021' % (photo, photo)).encode())
+
+        expected = list(map_file(self.path, mapping))
+        self.assertEqual(4, len(expected))
+        self.assertEqual({'rawtext': {}}, expected[2])
+        self.assertEqual(expected, list(scan_file(self.path, mapping)))
+
+        self.write(b'x\r\nx,y\r\n')
+        invalid_mapping = [{'column': 'a', 'mappings': [{'field': 'a'}]}, {}]
+        for map_or_scan in (map_file, scan_file):
+            errors = []
+            results = list(map_or_scan(self.path, invalid_mapping, header=False,
+                                       on_error=errors.append))
+            self.assertEqual([{'a': 'x', 'rawtext': {'a': 'x'}}], results)
+            self.assertEqual(['row 2: Wrong number of columns'], [str(error) for error in errors])
+
+    def test_should_scan_with_compiled_plans(self):
+        self.write(b'name,notes,photo,date\nsmith,n1,,01/02/2020\n')
+        expected = list(map_file(self.path, mapping))
+
+        profiler = MappingProfiler()
+        for plan in (profiler.instrument(mapping), compile_mapping(mapping, memoize=True)):
+            self.assertEqual(expected, list(scan_file(self.path, plan)))
+
+        self.assertEqual(1, len([stats for stats in profiler.report() if stats['field'] == 'date']))
+
+    def test_should_scan_fixed_width_records(self):
+        self.write(b'name  notesphoto   date      \n'
+                   b'smith xxxxxaGVsbG8=01/02/2020\n'
+                   b'jones\n')
+        widths = [6, 5, 8, 10]
+
+        expected = list(map_file(self.path, mapping, format='fixed', widths=widths))
+        self.assertEqual(expected, list(scan_file(self.path, mapping, format='fixed', widths=widths)))
+
+    def test_should_never_decode_unused_or_filtered_fields(self):
+        self.write(b'name,notes,photo,date\nsmith,\xff,,01/02/2020\n\xff\xff,n2,,\n')
+
+        results = list(scan_file(self.path, mapping, where=lambda record: record[0] != 0xff))
+        self.assertEqual(['SMITH'], [attributes['name'] for attributes in results])
+
+    def test_should_only_decode_columns_of_selected_fields(self):
+        self.write(b'name,notes,photo,date\nsmith,n1,\xff,\xff\n')
+
+        self.assertEqual([{'name': 'SMITH', 'rawtext': {'name': 'smith'}}],
+                         list(scan_file(self.path, mapping, fields=['name'])))
+
+    def test_should_scan_empty_files(self):
+        self.write(b'')
+        self.assertEqual([], list(scan_file(self.path, mapping)))
+
+if __name__ == '__main__':
+    unittest.main()
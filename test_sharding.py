@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+
+from mapper import compile_mapping
+from mapper.bulk import bulk_mapped_lines, ErrorLog
+from mapper.readers import delimited_lines
+from mapper.sharding import map_shard, map_sharded, merge_partitions, serialised, shard_ranges
+
+mapping = [
+    {'column': 'code', 'mappings': [{'field': 'code', 'validates': {'presence': True}}]},
+    {'column': 'name', 'mappings': [{'field': 'name', 'clean': ':name'}]},
+    {'column': 'date', 'mappings': [{'field': 'date', 'format': '%d/%m/%Y'}]}
+]
+
+class TestSharding(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, 'extract.csv')
+
+        with open(self.path, 'w', newline='') as file:
+            file.write('name,code,date\n')
+            for i in range(200):
+                file.write('smith %d,%s,%02d/01/2020\n' % (i, '' if i % 7 == 3 else 'C%d' % i, i % 28 + 1))
+
+    def read_json_lines(self, path):
+        with open(path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_should_split_shards_on_record_boundaries(self):
+        shards = shard_ranges(self.path, 5)
+        with open(self.path, 'rb') as file:
+            content = file.read()
+
+        self.assertEqual(len(b'name,code,date\n'), shards[0].start)
+        self.assertEqual(len(content), shards[-1].end)
+        for previous, shard in zip(shards, shards[1:]):
+            self.assertEqual(previous.end, shard.start)
+            self.assertEqual(b'\n', content[shard.start - 1:shard.start])
+
+    def test_should_allow_more_shards_than_records(self):
+        with open(self.path, 'w') as file:
+            file.write('name,code,date\nbob,C1,01/01/2020\n')
+
+        shards = shard_ranges(self.path, 4)
+        self.assertEqual(1, sum(1 for shard in shards if shard.end > shard.start))
+
+    def test_should_match_unsharded_mapping(self):
+        output = os.path.join(self.directory, 'output.jsonl')
+        errors_output = os.path.join(self.directory, 'errors.jsonl')
+
+        totals = map_sharded(self.path, mapping, output, errors_output, shards=5, workers=2)
+
+        errors = ErrorLog()
+        lines = delimited_lines(self.path)
+        next(lines)
+        reordered = [mapping[1], mapping[0], mapping[2]]
+        with self.assertLogs('mapper.bulk', 'WARNING'):
+            expected = [json.loads(json.dumps(attributes, default=serialised))
+                        for attributes in bulk_mapped_lines(lines, reordered, errors)]
+
+        self.assertEqual(expected, self.read_json_lines(output))
+        self.assertEqual([list(entry) for entry in errors], self.read_json_lines(errors_output))
+        self.assertEqual({'rows': 200, 'failed_rows': 29}, totals)
+
+    def test_should_compile_shards_with_plan_options(self):
+        output = os.path.join(self.directory, 'output.jsonl')
+
+        map_sharded(self.path, mapping, output, shards=2, workers=2, memoize=True, rawtext=False)
+
+        self.assertEqual({'name': 'SMITH 0', 'code': 'C0', 'date': '2020-01-01T00:00:00'},
+                         self.read_json_lines(output)[0])
+
+    def test_should_only_map_selected_fields(self):
+        output = os.path.join(self.directory, 'output.jsonl')
+        totals = map_sharded(self.path, mapping, output, shards=2, workers=2, fields=['name'])
+
+        self.assertEqual({'rows': 200, 'failed_rows': 0}, totals)
+        self.assertEqual({'name': 'SMITH 0', 'rawtext': {'name': 'smith 0'}},
+                         self.read_json_lines(output)[0])
+
+    def test_should_refuse_compiled_plans(self):
+        with self.assertRaises(Exception) as context:
+            map_sharded(self.path, compile_mapping(mapping), os.path.join(self.directory, 'out'))
+
+        self.assertIn('not a compiled plan', str(context.exception))
+
+    def test_should_refuse_to_merge_incomplete_partitions(self):
+        shards = shard_ranges(self.path, 2)
+        reordered = [mapping[1], mapping[0], mapping[2]]
+        with self.assertLogs('mapper.bulk', 'WARNING'):
+            map_shard(self.path, shards[1], reordered, self.directory)
+
+        with self.assertRaises(Exception):
+            merge_partitions(self.directory, 2, os.path.join(self.directory, 'output.jsonl'))
+
+if __name__ == '__main__':
+    unittest.main()
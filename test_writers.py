@@ -0,0 +1,89 @@
+import csv
+from datetime import date, datetime
+import json
+import os
+import tempfile
+import unittest
+
+from mapper import mapped_lines
+from mapper.writers import BatchWriter, mapping_schema, pyarrow, write_mapped, writer_for
+
+mapping = [
+    {'column': 'name', 'mappings': [{'field': 'name', 'clean': ':name'}]},
+    {'column': 'born', 'mappings': [{'field': 'born', 'format': '%d/%m/%Y'}]},
+    {'column': 'seen', 'mappings': [{'field': 'seen', 'format': '%d/%m/%Y %H:%M'}]},
+    {'column': 'code', 'mappings': [{'field': 'codes', 'order': 1, 'join': ','}]},
+    {'column': 'code2', 'mappings': [{'field': 'codes', 'order': 2}]}
+]
+
+lines = [
+    ['bob', '01/02/1980', '03/04/2020 10:30', 'C1', 'C2'],
+    ['sue', '', '', 'C3', '']
+]
+
+class TestWriters(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_should_derive_schema_from_mapping(self):
+        self.assertEqual([
+            ('name', 'string'), ('born', 'date'), ('seen', 'timestamp'), ('codes', 'string')
+        ], mapping_schema(mapping))
+        self.assertEqual(('rawtext.code2', 'string'), mapping_schema(mapping, rawtext=True)[-1])
+
+    def test_should_write_csv_in_batches(self):
+        path = os.path.join(self.directory, 'mapped.csv')
+        self.assertEqual(2, write_mapped(path, mapped_lines(lines, mapping), mapping,
+                                         rawtext=True, batch_size=1))
+
+        with open(path, newline='') as file:
+            rows = list(csv.reader(file))
+
+        self.assertEqual(['name', 'born', 'seen', 'codes'], rows[0][:4])
+        self.assertEqual(['BOB', '1980-02-01', '2020-04-03T10:30:00', 'C1,C2', 'bob'], rows[1][:5])
+        self.assertEqual(['SUE', '', '', 'C3'], rows[2][:4])
+
+    def test_should_write_json_lines(self):
+        path = os.path.join(self.directory, 'mapped.jsonl')
+        with writer_for(path, mapping, batch_size=10) as writer:
+            for attributes in mapped_lines(lines, mapping):
+                writer.write(attributes)
+
+        with open(path) as file:
+            rows = [json.loads(line) for line in file]
+
+        self.assertEqual({'name': 'SUE', 'codes': 'C3'}, rows[1])
+        self.assertEqual('1980-02-01', rows[0]['born'])
+
+    def test_should_refuse_unknown_formats(self):
+        with self.assertRaises(Exception):
+            writer_for(os.path.join(self.directory, 'mapped.xls'), mapping, format='xls')
+
+    def test_should_require_writers_to_write_batches(self):
+        class IncompleteWriter(BatchWriter):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteWriter(os.path.join(self.directory, 'mapped.out'), mapping_schema(mapping))
+
+    @unittest.skipUnless(pyarrow, 'requires pyarrow')
+    def test_should_write_parquet_and_arrow(self):
+        import pyarrow.parquet
+
+        for name in ('mapped.parquet', 'mapped.arrow'):
+            path = os.path.join(self.directory, name)
+            write_mapped(path, mapped_lines(lines, mapping), mapping, batch_size=1)
+
+            if name.endswith('.parquet'):
+                table = pyarrow.parquet.read_table(path)
+            else:
+                table = pyarrow.ipc.open_file(path).read_all()
+
+            self.assertEqual([date(1980, 2, 1), None], table.column('born').to_pylist())
+            self.assertEqual([datetime(2020, 4, 3, 10, 30), None], table.column('seen').to_pylist())
+
+if __name__ == '__main__':
+    unittest.main()